@@ -10,17 +10,14 @@ from django.contrib.admin.views.decorators import staff_member_required
 import django.forms as forms
 from django.db.models import Q
 
-from members.models import get_active_members, ContactInfo, KindOfMembership
+from members.models import get_active_members, get_monthly_fees, ContactInfo, KindOfMembership
 
 
 def _announce_filter_collection(users):
     users = users.filter(paymentinfo__bank_collection_allowed=True) \
                     .filter(paymentinfo__bank_collection_mode__id=4)
-    for u in users:
-        debt = u.contactinfo.get_debt_for_month(date.today())
-        if debt == 0:
-            users = users.exclude(pk=u.pk)
-    return users
+    monthly_fees = get_monthly_fees(list(users.values_list('pk', flat=True)), date.today())
+    return users.exclude(pk__in=[pk for pk, fee in monthly_fees.items() if fee == 0])
 
 def _announce_filter_keymembers(users):
     return users.filter(contactinfo__has_active_key=True) \
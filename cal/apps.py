@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class CalConfig(AppConfig):
+    name = 'cal'
+
+    def ready(self):
+        from . import signals  # noqa: F401
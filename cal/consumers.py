@@ -0,0 +1,31 @@
+from asgiref.sync import async_to_sync
+from channels.generic.websocket import JsonWebsocketConsumer
+
+from .live import EVENTS_GROUP, serialize_event
+from .models import Event
+
+
+class EventConsumer(JsonWebsocketConsumer):
+    """
+    Sends the events of the cellar door display on connect and on request,
+    and every change of an event in between (see cal.live).
+    """
+
+    def connect(self):
+        async_to_sync(self.channel_layer.group_add)(EVENTS_GROUP, self.channel_name)
+        self.accept()
+        self.send_resync()
+
+    def disconnect(self, code):
+        async_to_sync(self.channel_layer.group_discard)(EVENTS_GROUP, self.channel_name)
+
+    def receive_json(self, content):
+        if content.get('type') == 'resync':
+            self.send_resync()
+
+    def send_resync(self):
+        events = Event.future.all()
+        self.send_json({'type': 'resync', 'events': [serialize_event(event) for event in events]})
+
+    def event_change(self, message):
+        self.send_json({'type': 'event', 'change': message['change'], 'event': message['event']})
@@ -0,0 +1,120 @@
+"""
+Pre-serialized iCalendar feeds.
+
+All feeds are assembled from one index of serialized VEVENTs, which is
+built with a fixed number of queries and cached. cal.signals deletes the
+index when an event, category or location changes. The serialized events
+are joined into the calendar directly, which gives the same bytes as
+Calendar.to_ical.
+
+Calendar clients poll the full feed every few minutes, so it is also cached
+gzipped until the index changes.
+"""
+import gzip
+import hashlib
+import re
+from collections import namedtuple
+
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+
+from core.models import Category, Location
+from . import create_calendar
+from .models import Event
+
+ICAL_INDEX_CACHE_KEY = 'cal.ical.index'
+FULL_ICAL_CACHE_KEY = 'cal.ical.full'
+ICAL_CACHE_TIMEOUT = 24 * 60 * 60
+CALENDAR_END = b'END:VCALENDAR\r\n'
+
+ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+
+# category and location are names, entries are ordered latest first
+IcalEntry = namedtuple('IcalEntry', ['pk', 'startDate', 'category', 'location', 'advertise', 'vevent'])
+IcalIndex = namedtuple('IcalIndex', ['entries', 'categories', 'locations'])
+IcalFeed = namedtuple('IcalFeed', ['body', 'gzipped', 'etag'])
+
+
+def make_entry(event, domain):
+    return IcalEntry(
+        pk=event.pk,
+        startDate=event.startDate,
+        category=event.category.name if event.category_id else None,
+        location=event.location.name if event.location_id else None,
+        advertise=event.advertise,
+        vevent=event.get_icalendar_event(domain).to_ical(),
+    )
+
+
+def get_ical_index():
+    index = cache.get(ICAL_INDEX_CACHE_KEY)
+    if index is None:
+        domain = Site.objects.get_current().domain
+        events = Event.all.select_related('created_by', 'category', 'location')
+        entries = [make_entry(event, domain) for event in events]
+        entries.sort(key=lambda entry: (entry.startDate, entry.pk), reverse=True)
+        index = IcalIndex(
+            entries=entries,
+            categories=set(Category.objects.values_list('name', flat=True)),
+            locations=set(Location.objects.values_list('name', flat=True)),
+        )
+        cache.set(ICAL_INDEX_CACHE_KEY, index, ICAL_CACHE_TIMEOUT)
+    return index
+
+
+def invalidate_ical_feeds():
+    cache.delete_many([ICAL_INDEX_CACHE_KEY, FULL_ICAL_CACHE_KEY])
+
+
+def serialize_calendar(vevents):
+    """Returns the calendar of the serialized VEVENTs like create_calendar(...).to_ical()."""
+    head = create_calendar([]).to_ical()
+    return head[:-len(CALENDAR_END)] + b''.join(vevents) + CALENDAR_END
+
+
+def make_feed(entries):
+    body = serialize_calendar(entry.vevent for entry in entries)
+    return IcalFeed(
+        body=body,
+        gzipped=gzip.compress(body, mtime=0),
+        etag='W/"%s"' % hashlib.md5(body).hexdigest(),
+    )
+
+
+def get_full_ical():
+    """Returns the IcalFeed of all events."""
+    feed = cache.get(FULL_ICAL_CACHE_KEY)
+    if feed is None:
+        index = get_ical_index()
+        feed = make_feed(index.entries)
+        cache.set(FULL_ICAL_CACHE_KEY, feed, ICAL_CACHE_TIMEOUT)
+    return feed
+
+
+def get_filtered_ical(index, **filters):
+    """
+    Returns the IcalFeed of the events in ``index`` whose entries have the
+    given values, e.g. category='Workshop'.
+    """
+    entries = [
+        entry for entry in index.entries
+        if all(getattr(entry, field) == value for field, value in filters.items())
+    ]
+    return make_feed(entries)
+
+
+def ical_response(request, feed):
+    """
+    Returns the feed, gzipped if the client accepts it, or 304 Not Modified
+    if the client's copy is current.
+    """
+    if ACCEPTS_GZIP.search(request.headers.get('Accept-Encoding', '')):
+        response = HttpResponse(feed.gzipped, content_type='text/calendar; charset=utf-8')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(feed.body, content_type='text/calendar; charset=utf-8')
+    patch_vary_headers(response, ('Accept-Encoding',))
+    response['ETag'] = feed.etag
+    return get_conditional_response(request, etag=feed.etag, response=response)
@@ -0,0 +1,40 @@
+"""
+Pushes event changes to the websocket clients of cal.consumers.EventConsumer,
+e.g. the cellar door display.
+
+Every change is sent as {"type": "event", "change": "created", "updated" or
+"deleted", "event": {...}}, see serialize_event. Clients send
+{"type": "resync"} to get the events they should show as
+{"type": "resync", "events": [...]}, e.g. after reconnecting or when a
+change may move events in or out of their list.
+"""
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.template.loader import render_to_string
+
+EVENTS_GROUP = 'events'
+
+
+def serialize_event(event):
+    """Returns the event with its entry in the event list as rendered HTML."""
+    return {
+        'id': event.pk,
+        'startDate': event.startDate.isoformat(),
+        'html': render_to_string('cal/eventinfo_nf.inc', {'event': event, 'new': 0}),
+    }
+
+
+def publish_event_change(change, event):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    if change == 'deleted':
+        data = {'id': event.pk}
+    else:
+        data = serialize_event(event)
+
+    message = {'type': 'event.change', 'change': change, 'event': data}
+    # clients reading the event list must see the change
+    transaction.on_commit(lambda: async_to_sync(channel_layer.group_send)(EVENTS_GROUP, message))
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cal', '0002_event_advertise'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['deleted', 'startDate', 'endDate'], name='cal_event_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['deleted', 'advertise', 'endDate'], name='cal_event_advertise_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cal', '0003_event_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='event',
+            name='cal_event_start_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='event',
+            name='cal_event_advertise_idx',
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['startDate', 'endDate'], name='cal_event_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['endDate', 'startDate'], name='cal_event_end_idx'),
+        ),
+    ]
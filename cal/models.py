@@ -10,7 +10,7 @@ from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
 from django.db import models
-from django.db.models import Q
+from django.db.models import Q, Subquery
 from django.urls import reverse
 
 from core.models import Category, Location
@@ -51,7 +51,12 @@ class FutureEventFixedNumberManager(EventManager):
         return self.get_n(num)
 
     def get_n(self, num, past_duration=datetime.timedelta(hours=5)):
-        all = super().get_queryset().order_by('startDate')
+        """
+        Returns the next <num> events by start date, or the <num> latest
+        events if there aren't enough future ones. Takes at most two queries:
+        the future window, and the latest events if it comes up short.
+        """
+        all = super().get_queryset().order_by('startDate', 'pk')
 
         if num == 0:
             return all
@@ -60,17 +65,21 @@ class FutureEventFixedNumberManager(EventManager):
             (Q(endDate__gte=datetime.datetime.now())) |
             (Q(endDate__isnull=True) &
              Q(startDate__gte=datetime.datetime.now() - past_duration))
-        ).order_by('startDate')  # event visible X hours/days/weeks/... after it started
+        )[:num]  # event visible X hours/days/weeks/... after it started
 
-        if(future.count() < num):
-            if(all.count() - num >= 0):
-                latest = all[all.count() - num:all.count()]
-            else:
-                latest = all
-        else:
-            latest = future[:num]
+        # evaluates and caches the window
+        if len(future) == num:
+            return future
 
-        return latest
+        # everything from the <num>th latest event on, or everything if
+        # there are fewer events
+        nth_latest = all.order_by('-startDate', '-pk')[num - 1:num]
+        return all.alias(nth_latest=Subquery(nth_latest.values('pk'))).filter(
+            Q(nth_latest__isnull=True) |
+            Q(startDate__gt=Subquery(nth_latest.values('startDate'))) |
+            Q(startDate=Subquery(nth_latest.values('startDate')),
+              pk__gte=Subquery(nth_latest.values('pk')))
+        )
 
 
 class Event(models.Model):
@@ -115,6 +124,12 @@ class Event(models.Model):
     all = EventManager.from_queryset(EventQuerySet)()
     future = FutureEventFixedNumberManager.from_queryset(EventQuerySet)()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['startDate', 'endDate'], name='cal_event_start_idx'),
+            models.Index(fields=['endDate', 'startDate'], name='cal_event_end_idx'),
+        ]
+
     def __str__(self):
         status = ''
         if self.deleted:
@@ -145,8 +160,8 @@ class Event(models.Model):
         if commit:
             self.save()
 
-    def get_icalendar_event(self):
-        domain = Site.objects.get_current().domain
+    def get_icalendar_event(self, domain=None):
+        domain = domain or Site.objects.get_current().domain
         rv = icalEvent()
 
         rv.add('uid', '%d@%s' % (self.id, domain))
@@ -164,7 +179,8 @@ class Event(models.Model):
 
         if self.who:
             rv.add('organizer', self.who)
-        elif self.created_by_id and User.objects.filter(id=self.created_by_id):
+        elif self.created_by_id:
+            # the foreign key ensures the user exists
             rv.add('organizer', self.created_by)
 
         if self.location:
@@ -0,0 +1,48 @@
+"""
+Cache of the rendered month calendars (see cal.views.EventCalendar).
+
+Every month is cached twice, with and without the edit links for logged in
+users. The current month also marks today, so its key contains the date and
+the page rendered yesterday isn't used after midnight. cal.signals deletes
+the months an event is shown in when it changes. The events show the names
+of their locations, so the keys also contain the version of the locations.
+"""
+from datetime import date, time, timedelta
+
+from dateutil.rrule import rrule, MONTHLY
+from django.core.cache import cache
+
+from core.cache import get_data_version
+
+MONTH_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def get_month_cache_key(year, month, admin, today=None):
+    today = today or date.today()
+    key = 'cal.month.%s.%04d-%02d.%s' % (
+        get_data_version('locations'), year, month, 'admin' if admin else 'public')
+    if (today.year, today.month) == (year, month):
+        key += '.' + today.isoformat()
+    return key
+
+
+def get_event_months(start, end):
+    """
+    Returns the (year, month) of every month an event from start to end (or
+    without an end) is shown in. An event starting at midnight is also shown
+    on the day before.
+    """
+    first_day = start.date()
+    if start.time() == time.min:
+        first_day -= timedelta(days=1)
+    last_day = max((end or start).date(), first_day)
+    months = rrule(MONTHLY, dtstart=first_day.replace(day=1), until=last_day)
+    return [(m.year, m.month) for m in months]
+
+
+def invalidate_event_months(start, end):
+    cache.delete_many([
+        get_month_cache_key(year, month, admin)
+        for year, month in get_event_months(start, end)
+        for admin in (False, True)
+    ])
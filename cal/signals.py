@@ -0,0 +1,64 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from core.cache import bump_data_version
+from core.models import Category, Location
+from .ical import invalidate_ical_feeds
+from .live import publish_event_change
+from .models import Event
+from .month_cache import invalidate_event_months
+
+
+@receiver(pre_save, sender=Event)
+def remember_previous_dates(sender, instance, **kwargs):
+    # moving an event also changes the months it was shown in before
+    if instance.pk is not None:
+        instance._previous = Event.objects.filter(pk=instance.pk).values('startDate', 'endDate').first()
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def invalidate_months(sender, instance, **kwargs):
+    invalidate_event_months(instance.startDate, instance.endDate)
+    previous = getattr(instance, '_previous', None)
+    if previous:
+        invalidate_event_months(previous['startDate'], previous['endDate'])
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+def invalidate_feeds(sender, instance, **kwargs):
+    # the feeds show the events with the names of their category and location
+    invalidate_ical_feeds()
+
+
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+def bump_locations_version(sender, instance, **kwargs):
+    # the month calendars show the location names
+    bump_data_version('locations')
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def bump_events_version(sender, instance, **kwargs):
+    bump_data_version('events')
+
+
+@receiver(post_save, sender=Event)
+def publish_saved_event(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    if instance.deleted:
+        publish_event_change('deleted', instance)
+    else:
+        publish_event_change('created' if created else 'updated', instance)
+
+
+@receiver(post_delete, sender=Event)
+def publish_deleted_event(sender, instance, **kwargs):
+    publish_event_change('deleted', instance)
@@ -1,11 +1,21 @@
+import gzip
+import random
 from datetime import datetime, timedelta
 
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.testing import WebsocketCommunicator
 from django.contrib.auth.models import User
+from django.contrib.sites.models import Site
+from django.core.cache import cache
 from django.test import TestCase
 from django.test.client import Client
+from freezegun import freeze_time
 
 from .forms import EventForm
-from .models import Event
+from . import create_calendar
+from .consumers import EventConsumer
+from .models import Category, Event, Location
+from .views import EventCalendar
 from .feeds import EventFeed
 
 
@@ -127,3 +137,315 @@ class EventFeedTest(TestCase):
 
     def testPastEvents(self):
         self.assertNotIn(self.past_event, self.items)
+
+
+class FutureEventsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='admin')
+        self.now = datetime.now().replace(microsecond=0)
+
+    def create_events(self, offsets):
+        Event.objects.bulk_create([
+            Event(name=f'Event {i}', created_by=self.user, deleted=deleted,
+                  startDate=self.now + timedelta(hours=start),
+                  endDate=None if duration is None else self.now + timedelta(hours=start + duration))
+            for i, (start, duration, deleted) in enumerate(offsets)
+        ])
+
+    def expected(self, num):
+        events = sorted(Event.all.all(), key=lambda e: (e.startDate, e.pk))
+        future = [e for e in events if (e.endDate or e.startDate + timedelta(hours=5)) >= datetime.now()]
+        return future[:num] if len(future) >= num else events[-num:]
+
+    def testMatchesTheFixedNumberRule(self):
+        rng = random.Random(42)
+        for _ in range(10):
+            Event.objects.all().delete()
+            self.create_events([
+                (rng.choice([-100, -50, -3, 0, 2, 50]), rng.choice([None, 1, 100]), rng.random() < 0.2)
+                for _ in range(rng.randrange(12))
+            ])
+            for num in range(1, 8):
+                self.assertEqual(list(Event.future.get_n(num)), self.expected(num))
+
+    def testAtMostTwoQueries(self):
+        self.create_events([(-10, 1, False)] * 3 + [(10, 1, False)] * 3)
+        with self.assertNumQueries(1):
+            list(Event.future.get_n(3))
+        with self.assertNumQueries(2):
+            list(Event.future.get_n(5))
+
+
+class EventCalendarTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='admin')
+
+    def testBucketsLikeTheDailyFilter(self):
+        rng = random.Random(7)
+        month = datetime(2023, 3, 1)
+        Event.objects.bulk_create([
+            Event(name=f'Event {i}', created_by=self.user, wikiPage='Event',
+                  startDate=start,
+                  endDate=rng.choice([None, start, start + timedelta(hours=rng.randrange(0, 24 * 40))]))
+            for i in range(60)
+            for start in [month + timedelta(hours=rng.choice([-24 * 45, -24, -1, 0, 1])
+                                            + rng.randrange(0, 24 * 32))]
+        ])
+
+        calendar = EventCalendar(Event.all)
+        calendar.formatmonth(2023, 3)
+        for day in range(1, 32):
+            d = datetime(2023, 3, day)
+            d1 = d + timedelta(days=1)
+            expected = Event.all.exclude(startDate__gt=d1).exclude(endDate__lt=d, endDate__isnull=False)\
+                .exclude(endDate__isnull=True, startDate__lt=d).order_by('pk')
+            self.assertEqual(calendar.events_by_day.get(day, []), list(expected), day)
+
+    def testConstantNumberOfQueries(self):
+        Event.objects.bulk_create([
+            Event(name=f'Event {day}', created_by=self.user, wikiPage='Event',
+                  startDate=datetime(2023, 3, day, 19), endDate=datetime(2023, 3, day, 22))
+            for day in range(1, 32)
+        ])
+        with self.assertNumQueries(1):
+            EventCalendar(Event.all, admin=True).formatmonth(2023, 3)
+
+
+class MonthCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='admin')
+        self.event = Event(name='Lötabend', created_by=self.user, wikiPage='Loetabend',
+                           startDate=datetime(2023, 3, 30, 19), endDate=datetime(2023, 4, 1, 22))
+        self.event.save()
+
+    def render(self, month):
+        return self.client.get(f'/calendar/2023/{month:02d}/').context['rendered_calendar']
+
+    def testRenderedOnce(self):
+        self.render(3)
+        with self.assertNumQueries(2):  # date list and latest events
+            self.assertIn('Lötabend', self.render(3))
+
+    def testSaveInvalidatesTheMonthsOfTheEvent(self):
+        for month in 3, 4, 5:
+            self.render(month)
+
+        self.event.name = 'Nähabend'
+        self.event.save()
+        self.assertIn('Nähabend', self.render(3))
+        self.assertIn('Nähabend', self.render(4))
+
+        self.event.startDate = datetime(2023, 5, 2, 19)
+        self.event.endDate = datetime(2023, 5, 2, 22)
+        self.event.save()
+        self.assertNotIn('Nähabend', self.render(3))
+        self.assertNotIn('Nähabend', self.render(4))
+        self.assertIn('Nähabend', self.render(5))
+
+        self.event.delete()
+        self.assertNotIn('Nähabend', self.render(5))
+
+    def testRenamingTheLocation(self):
+        self.event.location = Location.objects.create(name='Hauptraum')
+        self.event.save()
+        self.assertIn('Hauptraum', self.render(3))
+
+        self.event.location.name = 'Lounge'
+        self.event.location.save()
+        self.assertIn('Lounge', self.render(3))
+
+    def testAdminVariant(self):
+        self.render(3)
+        self.client.force_login(self.user)
+        self.assertIn('class="edit"', self.render(3))
+
+    def testTodayMarkerMovesAtMidnight(self):
+        with freeze_time('2023-03-14 23:59'):
+            self.assertIn('<td class="tue today filled">14', self.render(3))
+        with freeze_time('2023-03-15 00:01'):
+            self.assertIn('<td class="wed today filled">15', self.render(3))
+
+
+class FullIcalTest(TestCase):
+    url = '/calendar/export/ical_full/'
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='admin')
+        for i in range(5):
+            Event(name=f'Event {i}', created_by=self.user, wikiPage='Event', teaser='Teaser',
+                  advertise=i % 2, startDate=datetime(2023, 3, 1 + i, 19),
+                  endDate=datetime(2023, 3, 1 + i, 22) if i % 3 else None).save()
+
+    def testSameAsTheCalendarOfAllEvents(self):
+        events = Event.all.order_by('-startDate', '-pk')
+        expected = create_calendar([e.get_icalendar_event() for e in events]).to_ical()
+        self.assertEqual(self.client.get(self.url).content, expected)
+
+    def testCachedUntilAnEventChanges(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+        event = Event.all.first()
+        event.name = 'Renamed'
+        event.save()
+        self.assertIn(b'Renamed', self.client.get(self.url).content)
+
+    def testQueriesDoNotDependOnTheNumberOfEvents(self):
+        Site.objects.get_current()  # cached by Django
+        with self.assertNumQueries(3):  # events, categories, locations
+            self.client.get(self.url)
+
+    def testConditionalGet(self):
+        response = self.client.get(self.url)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertNotIn('Last-Modified', response)
+
+        Event.all.first().delete()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def testGzip(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), self.client.get(self.url).content)
+
+
+class FilteredIcalTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='admin')
+        self.workshop = Category.objects.create(name='Workshop')
+        self.jour_fixe = Category.objects.create(name='Jour Fixe')
+        self.main_room = Location.objects.create(name='Hauptraum')
+        self.events = []
+        for i, (category, location, advertise) in enumerate([
+            (self.workshop, self.main_room, True),
+            (self.jour_fixe, self.main_room, False),
+            (self.workshop, None, False),
+            (None, None, True),
+        ]):
+            event = Event(name=f'Event {i}', created_by=self.user, wikiPage='Event', category=category,
+                          location=location, advertise=advertise, startDate=datetime(2023, 3, 1 + i, 19))
+            event.save()
+            self.events.append(event)
+
+    def expected(self, events):
+        events = sorted(events, key=lambda e: (e.startDate, e.pk), reverse=True)
+        return create_calendar([e.get_icalendar_event() for e in events]).to_ical()
+
+    def testFeeds(self):
+        e = self.events
+        for url, events in [
+            ('/calendar/export/ical/category/Workshop/', [e[0], e[2]]),
+            ('/calendar/export/ical/category/Jour Fixe/', [e[1]]),
+            ('/calendar/export/ical/location/Hauptraum/', [e[0], e[1]]),
+            ('/calendar/export/ical/public/', [e[0], e[3]]),
+            ('/calendar/export/ical_full/', e),
+        ]:
+            self.assertEqual(self.client.get(url).content, self.expected(events), url)
+
+    def testUnknownName(self):
+        self.assertEqual(self.client.get('/calendar/export/ical/category/Party/').status_code, 404)
+
+    def testIndexIsRebuiltAfterAChange(self):
+        url = '/calendar/export/ical/category/Workshop/'
+        self.client.get(url)
+        event = self.events[1]
+        event.category = self.workshop
+        event.save()
+        self.events[2].delete()
+
+        self.assertEqual(self.client.get(url).content, self.expected([self.events[0], event]))
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+    def testRenamingACategoryRebuildsTheIndex(self):
+        self.client.get('/calendar/export/ical/category/Workshop/')
+        self.workshop.name = 'Kurs'
+        self.workshop.save()
+        self.assertIn(b'CATEGORIES:Kurs', self.client.get('/calendar/export/ical/category/Kurs/').content)
+
+
+class PublicUpcomingTest(TestCase):
+    url = '/calendar/api/public_upcoming'
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='admin')
+        self.event = Event(name='Lötabend', created_by=self.user, wikiPage='Loetabend', advertise=True,
+                           startDate=datetime(2023, 3, 14, 19), endDate=datetime(2023, 3, 14, 22))
+        self.event.save()
+
+    @freeze_time('2023-03-10')
+    def testCachedUntilAnEventChanges(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.json()[0]['title'], 'Lötabend')
+        self.assertIn('max-age=60', response['Cache-Control'])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+            self.assertEqual(self.client.get(self.url).content, response.content)
+
+        self.event.name = 'Nähabend'
+        self.event.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.json()[0]['title'], 'Nähabend')
+
+    def testNewDay(self):
+        with freeze_time('2023-03-14'):
+            self.assertEqual(len(self.client.get(self.url).json()), 1)
+        with freeze_time('2023-03-15'):
+            self.assertEqual(self.client.get(self.url).json(), [])
+
+
+class EventConsumerTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='admin')
+        self.event = self.create('Lötabend', days=1)
+
+    def create(self, name, days):
+        event = Event(name=name, created_by=self.user, wikiPage=name,
+                      startDate=datetime.now() + timedelta(days=days))
+        self.save(event)
+        return event
+
+    def save(self, event, delete=False):
+        with self.captureOnCommitCallbacks(execute=True):
+            if delete:
+                event.delete()
+            else:
+                event.save()
+
+    def testPublishesChanges(self):
+        async def receive():
+            communicator = WebsocketCommunicator(EventConsumer.as_asgi(), '/ws/calendar/')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            messages = [await communicator.receive_json_from()]
+
+            new_event = await sync_to_async(self.create)('Nähabend', days=2)
+            messages.append(await communicator.receive_json_from())
+            self.event.name = 'Lötabend!'
+            await sync_to_async(self.save)(self.event)
+            messages.append(await communicator.receive_json_from())
+            await sync_to_async(self.save)(new_event, delete=True)
+            messages.append(await communicator.receive_json_from())
+
+            await communicator.send_json_to({'type': 'resync'})
+            messages.append(await communicator.receive_json_from())
+            await communicator.disconnect()
+            return new_event, messages
+
+        new_event, messages = async_to_sync(receive)()
+
+        resync, created, updated, deleted, resync_again = messages
+        self.assertEqual(resync['type'], 'resync')
+        self.assertEqual([e['id'] for e in resync['events']], [self.event.pk])
+        self.assertIn('Lötabend', resync['events'][0]['html'])
+        self.assertEqual((created['change'], created['event']['id']), ('created', new_event.pk))
+        self.assertEqual(updated['change'], 'updated')
+        self.assertIn('Lötabend!', updated['event']['html'])
+        self.assertEqual(deleted, {'type': 'event', 'change': 'deleted', 'event': {'id': new_event.pk}})
+        self.assertEqual([e['id'] for e in resync_again['events']], [self.event.pk])
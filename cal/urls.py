@@ -97,6 +97,24 @@ urlpatterns = [
         {},
         'full_ical',
     ),
+    path(
+        'export/ical/category/<str:name>/',
+        cal.views.filtered_ical,
+        {'typ': 'category'},
+        'category_ical',
+    ),
+    path(
+        'export/ical/location/<str:name>/',
+        cal.views.filtered_ical,
+        {'typ': 'location'},
+        'location_ical',
+    ),
+    path(
+        'export/ical/public/',
+        cal.views.filtered_ical,
+        {'typ': 'public'},
+        'public_ical',
+    ),
     path(
         'event/new/',
         cal.views.update_event,
@@ -1,4 +1,4 @@
-from datetime import date
+from datetime import date, time, timedelta
 from itertools import groupby
 import json
 import urllib.parse
@@ -10,14 +10,18 @@ from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, get_object_or_404
 from django.template import RequestContext
 from django.http import HttpResponse, HttpResponseNotAllowed, Http404
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
 from django.views.generic import ListView
 from django.utils import timezone
 from django.utils.html import conditional_escape as esc
 from django.utils.safestring import mark_safe
 
+from core.cache import cached_response
 from .forms import EventForm
 from .models import Event, Category, Location
+from .ical import get_filtered_ical, get_full_ical, get_ical_index, ical_response
+from .month_cache import MONTH_CACHE_TIMEOUT, get_month_cache_key
 from . import create_calendar
 
 
@@ -30,14 +34,12 @@ class EventCalendar(HTMLCalendar):
 
     def formatday(self, day, weekday):
         if day != 0:
-            d = date(self.year, self.month, day)
-            d1 = d + relativedelta.relativedelta(days=1)  # next day
             cssclass = self.cssclasses[weekday]
             if date.today() == date(self.year, self.month, day):
                 cssclass += ' today'
                 cssclass += ' filled'
             body = ['<ul class="daily-events">']
-            for event in self.events.exclude(startDate__gt=d1).exclude(endDate__lt=d, endDate__isnull=False).exclude(endDate__isnull=True, startDate__lt=d):
+            for event in self.events_by_day.get(day, []):
                 body.append('<li class="event">')
                 if self.admin:
                     body.append(u'<a href="%s" class="edit" title="edit">✏️</a>' % event.get_absolute_url())
@@ -59,10 +61,34 @@ class EventCalendar(HTMLCalendar):
         d = date(int(year), int(month), 1)
         prev = d - relativedelta.relativedelta(months=1)
         next = d + relativedelta.relativedelta(months=1)
-        
+        self.events_by_day = self.bucket_by_day(d, next)
+
         head = '<a href="/calendar/%04d/%02d/">&lt;</a> <a href="/calendar/%04d/%02d/">&gt;</a>' % (prev.year, prev.month, next.year, next.month)
         return head + super().formatmonth(year, month)
 
+    def bucket_by_day(self, first, end):
+        """
+        Returns a dict day of month -> events shown on that day for the days
+        from first up to end, with one query. An event is shown on every day
+        d with d <= endDate (startDate if it has no end) and startDate <= the
+        midnight after d.
+        """
+        events = self.events.exclude(startDate__gt=end).exclude(
+            endDate__lt=first, endDate__isnull=False).exclude(
+            endDate__isnull=True, startDate__lt=first).select_related('location').order_by('pk')
+
+        events_by_day = {}
+        for event in events:
+            day = event.startDate.date()
+            if event.startDate.time() == time.min:
+                day -= timedelta(days=1)
+            last_day = (event.endDate or event.startDate).date()
+            day, last_day = max(day, first), min(last_day, end - timedelta(days=1))
+            while day <= last_day:
+                events_by_day.setdefault(day.day, []).append(event)
+                day += timedelta(days=1)
+        return events_by_day
+
     def group_by_day(self, events):
         field = lambda event: event.startDate.day
         return dict(
@@ -77,9 +103,19 @@ class EventCalendar(HTMLCalendar):
         return self.formatmonth(t.year, t.month)
 
 
+def render_month(year, month, admin):
+    key = get_month_cache_key(year, month, admin)
+    rendered = cache.get(key)
+    if rendered is None:
+        rendered = EventCalendar(Event.all, admin).formatmonth(year, month)
+        cache.set(key, rendered, MONTH_CACHE_TIMEOUT)
+    return rendered
+
+
 def index(request):
     d = date.today() - relativedelta.relativedelta(days=2)
-    cal = EventCalendar(Event.all, request.user.is_authenticated).currentmonth()
+    t = date.today()
+    cal = render_month(t.year, t.month, request.user.is_authenticated)
     date_list = Event.all.all().datetimes('startDate', 'year')
     latest_events = Event.all.filter(startDate__gte=d).order_by('startDate')
 
@@ -98,7 +134,7 @@ def monthly(request, year, month):
 
     e = date(int(year), int(month), 1) + relativedelta.relativedelta(months=1)
     latest_events = Event.all.filter(startDate__gte=s, startDate__lt=e).order_by('startDate')
-    cal = EventCalendar(Event.all, request.user.is_authenticated).formatmonth(int(year), int(month))
+    cal = render_month(int(year), int(month), request.user.is_authenticated)
     date_list = Event.all.all().datetimes('startDate', 'year')
 
     return render(request, 'cal/event_archive.html', {
@@ -203,15 +239,30 @@ def event_icalendar(request, object_id):
 
 
 def complete_ical(request, num, past_duration):
-    events = Event.future.get_n(num, past_duration)
-
     if not num:
-        events = events.reverse()
+        return ical_response(request, get_full_ical())
 
+    events = Event.future.get_n(num, past_duration)
     calendar = create_calendar([x.get_icalendar_event() for x in events])
     return HttpResponse(calendar.to_ical(), content_type='text/calendar; charset=utf-8')
 
 
+def filtered_ical(request, typ, name=None):
+    """
+    Exports the events of a category or location, or the advertised events
+    """
+    index = get_ical_index()
+    if typ == 'category' and name in index.categories:
+        feed = get_filtered_ical(index, category=name)
+    elif typ == 'location' and name in index.locations:
+        feed = get_filtered_ical(index, location=name)
+    elif typ == 'public':
+        feed = get_filtered_ical(index, advertise=True)
+    else:
+        raise Http404
+    return ical_response(request, feed)
+
+
 class SpecialListView(ListView):
     template_name = "cal/event_special_list.html"
     events_by = None
@@ -224,6 +275,7 @@ class SpecialListView(ListView):
         return context
 
 
+@cached_response('events', key_func=lambda request: date.today())
 def public_upcoming(request):
     events = Event.objects.not_deleted().advertise().filter(
         endDate__gte=timezone.now().date(),
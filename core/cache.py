@@ -0,0 +1,95 @@
+"""
+Cached responses of endpoints which are polled by widgets, displays and
+directories.
+
+A response is cached per version of the data it shows. The signals of the
+models (see cal.signals and projects.signals) bump the data version, so the
+cached response is used until the data changes and serving it takes no
+query. Clients which send the ETag of the current response get a 304.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+DATA_VERSION_KEY = 'core.data_version.%s'
+RESPONSE_KEY = 'core.response.%s.%s'
+RESPONSE_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def get_data_version(name):
+    key = DATA_VERSION_KEY % name
+    version = cache.get(key)
+    if version is None:
+        # starting from the time keeps versions unique if the counter is
+        # evicted
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def _incr_data_version(name):
+    try:
+        cache.incr(DATA_VERSION_KEY % name)
+    except ValueError:
+        cache.set(DATA_VERSION_KEY % name, time.time_ns(), None)
+
+
+def bump_data_version(name):
+    """
+    Bumps the version now, so the rest of the transaction sees its changes,
+    and again on commit: a request which read the data before the commit
+    may have cached it under the first new version.
+    """
+    _incr_data_version(name)
+    transaction.on_commit(lambda: _incr_data_version(name))
+
+
+def make_etag(content):
+    return '"%s"' % hashlib.md5(content).hexdigest()
+
+
+def conditional_response(request, content, content_type, etag, max_age=60, private=False):
+    """
+    Returns the content with its ETag, or 304 Not Modified if the client's
+    copy is current. ``private`` content must not be kept by shared caches.
+    """
+    response = HttpResponse(content, content_type=content_type)
+    response['ETag'] = etag
+    if private:
+        patch_cache_control(response, private=True, max_age=max_age)
+    else:
+        patch_cache_control(response, public=True, max_age=max_age)
+    return get_conditional_response(request, etag=etag, response=response)
+
+
+def cached_response(*data, max_age=60, key_func=None):
+    """
+    Caches the responses of a view until one of the ``data`` versions
+    changes. ``key_func(request, *args, **kwargs)`` returns what else the
+    response depends on, e.g. today's date.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            versions = [str(get_data_version(name)) for name in data]
+            if key_func is not None:
+                versions.append(str(key_func(request, *args, **kwargs)))
+            key = RESPONSE_KEY % (view.__qualname__, hashlib.md5('.'.join(versions).encode()).hexdigest())
+
+            cached = cache.get(key)
+            if cached is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                cached = (response.content, response['Content-Type'], make_etag(response.content))
+                cache.set(key, cached, RESPONSE_CACHE_TIMEOUT)
+
+            content, content_type, etag = cached
+            return conditional_response(request, content, content_type, etag, max_age)
+        return wrapper
+    return decorator
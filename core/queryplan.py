@@ -0,0 +1,76 @@
+"""
+Finds the tables a query reads in full, so tests can catch hot lookups that
+don't use an index (anymore). Supports the backends in QUERY_PLAN_VENDORS.
+"""
+import re
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+SQLITE_SCAN = re.compile(r'\bSCAN (?:TABLE )?"?(\w+)"?(.*)$')
+POSTGRESQL_SCAN = re.compile(r'\bSeq Scan on "?(\w+)"?(?: "?(\w+)"?)?')
+# Django names the tables of subqueries and joins e.g. U0 or T3
+TABLE_ALIAS = re.compile(r'\b(?:FROM|JOIN) "?(\w+)"? (?:AS )?"?([A-Z]\d+)"?\b')
+
+
+def _sqlite_scans(cursor, sql, params):
+    cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+    scans = []
+    for row in cursor.fetchall():
+        match = SQLITE_SCAN.search(row[-1])
+        # SCAN ... USING (COVERING) INDEX walks an index
+        if match and 'USING' not in match.group(2):
+            scans.append(match.group(1))
+    return scans
+
+
+def _mysql_scans(cursor, sql, params):
+    cursor.execute('EXPLAIN ' + sql, params)
+    columns = [c[0].lower() for c in cursor.description]
+    rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    return [row['table'] for row in rows if row['type'] == 'ALL']
+
+
+def _postgresql_scans(cursor, sql, params):
+    cursor.execute('EXPLAIN ' + sql, params)
+    return [match.group(2) or match.group(1) for row in cursor.fetchall()
+            for match in [POSTGRESQL_SCAN.search(row[0])] if match]
+
+
+QUERY_PLAN_VENDORS = {
+    'sqlite': _sqlite_scans,
+    'mysql': _mysql_scans,
+    'postgresql': _postgresql_scans,
+}
+
+
+def get_full_table_scans(sql, params=None, using=DEFAULT_DB_ALIAS):
+    """Returns the names of the tables the database reads in full for ``sql``."""
+    connection = connections[using]
+    aliases = dict((alias, table) for table, alias in TABLE_ALIAS.findall(sql))
+    with connection.cursor() as cursor:
+        scans = QUERY_PLAN_VENDORS[connection.vendor](cursor, sql, params)
+    return [aliases.get(table, table) for table in scans]
+
+
+@contextmanager
+def assert_no_full_table_scans(tables, using=DEFAULT_DB_ALIAS):
+    """
+    Fails if one of the SELECT queries run in the block reads one of
+    ``tables`` in full.
+    """
+    with CaptureQueriesContext(connections[using]) as context:
+        yield
+
+    failures = []
+    for query in context.captured_queries:
+        sql = query['sql']
+        if not sql.lstrip().upper().startswith('SELECT'):
+            continue
+        scanned = set(get_full_table_scans(sql, using=using)) & set(tables)
+        if scanned:
+            failures.append(f'{", ".join(sorted(scanned))}: {sql}')
+
+    if failures:
+        raise AssertionError('full table scans in\n' + '\n'.join(failures))
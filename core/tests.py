@@ -0,0 +1,67 @@
+import io
+import json
+from datetime import date, datetime, timedelta
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+
+from cal.models import Event
+from members.models import KindOfMembership, MembershipFee, MembershipPeriod, Payment, \
+    PaymentMethod, get_active_members_for
+from members.tests.test_bank_import import erste_transaction
+
+from .queryplan import QUERY_PLAN_VENDORS, assert_no_full_table_scans, get_full_table_scans
+
+
+@skipUnless(connection.vendor in QUERY_PLAN_VENDORS, 'no query plans for this database')
+class QueryPlanTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='member', is_superuser=True)
+        kind = KindOfMembership.objects.create(name='Mitglied')
+        MembershipFee.objects.create(kind_of_membership=kind, amount=20, start=date(2000, 1, 1))
+        MembershipPeriod.objects.create(user=self.user, kind_of_membership=kind,
+                                        begin=date(2020, 1, 1))
+        method = PaymentMethod.objects.create(name='bank transfer')
+        Payment.objects.create(user=self.user, method=method, amount=20,
+                               date=date(2023, 6, 1), original_line='REF1')
+        Event.objects.bulk_create([
+            Event(name=f'Event {days}', created_by=self.user, advertise=days % 2,
+                  startDate=datetime.now() + timedelta(days=days),
+                  endDate=datetime.now() + timedelta(days=days, hours=2))
+            for days in range(-3, 3)
+        ])
+
+    def test_detects_full_table_scans(self):
+        self.assertEqual(get_full_table_scans("SELECT * FROM cal_event WHERE name = 'x'"),
+                         ['cal_event'])
+        with self.assertRaises(AssertionError):
+            with assert_no_full_table_scans(['cal_event']):
+                list(Event.objects.filter(name='x'))
+        # scans of aliased tables, e.g. in subqueries
+        self.assertEqual(get_full_table_scans(
+            "SELECT * FROM auth_user WHERE id IN (SELECT U0.created_by_id FROM cal_event U0 WHERE U0.name = 'x')"),
+            ['cal_event'])
+
+    def test_active_members(self):
+        with assert_no_full_table_scans(['members_membershipperiod']):
+            list(get_active_members_for(date.today()))
+
+    def test_future_events(self):
+        with assert_no_full_table_scans(['cal_event']):
+            list(Event.future.get_n(3))
+            list(Event.future.get_n(10))
+
+    def test_public_upcoming(self):
+        with assert_no_full_table_scans(['cal_event']):
+            self.client.get('/calendar/api/public_upcoming')
+
+    def test_bank_import(self):
+        self.client.force_login(self.user)
+        upload = io.BytesIO(json.dumps([erste_transaction(i, 'Member', 'AT00') for i in range(3)]).encode())
+        upload.name = 'erste.json'
+        with assert_no_full_table_scans(['members_payment']):
+            self.client.post('/member/bank/json/import', {'statement': upload})
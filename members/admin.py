@@ -2,6 +2,8 @@ from re import template
 from typing import Optional
 from datetime import datetime
 import csv
+import tempfile
+import time
 from django.http.request import HttpRequest
 
 
@@ -13,12 +15,14 @@ from django.contrib.auth.models import User
 from django.db.models import Q
 from django.db.models import OuterRef
 from django.db.models import Subquery
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponse
 from django.contrib.auth.admin import UserAdmin
 from django.template.loader import get_template
 from django.conf import settings
 from django.contrib import messages
 
+from core.utils import human_readable_time
+
 from .models import BankCollectionMode, ContactInfo, KindOfMembership
 from .models import Locker, MailinglistMail, MembershipFee, MembershipPeriod
 from .models import Payment, PaymentInfo, PendingPayment, BankImportMatcher
@@ -99,23 +103,32 @@ def make_sepa_xml_for_members(modeladmin, request, queryset):
     queryset = queryset.filter(Q(membershipperiod__begin__lte=dt), Q(membershipperiod__end__isnull=True) | Q(membershipperiod__end__gte=dt))
     queryset = queryset.distinct()
 
+    start = time.time()
     PendingPayment.objects.all().delete()
+    timings = [('delete pending payments', time.time() - start)]
 
     try:
-        sepa, sepaxml_filename = generate_sepa(request.user, queryset)
+        sepa, sepaxml_filename, run_timings = generate_sepa(request.user, queryset)
     except SepaException as ex:
         messages.error(request, str(ex))
         return
+    timings += run_timings
 
+    start = time.time()
+    sepa_file = tempfile.NamedTemporaryFile()
     try:
-        sepa_export = sepa.export()
+        sepa.write(sepa_file)
     except sepaxml.validation.ValidationError as ex:
+        sepa_file.close()
         messages.error(request, str(ex) + ": " + str(ex.__cause__))
         return
+    timings.append(('export xml', time.time() - start))
 
-    response = HttpResponse(sepa_export, content_type='application/xml; charset=utf-8')
-    response['Content-Disposition'] = f'attachment; filename="{sepaxml_filename}"'
-    return response
+    messages.info(request, 'SEPA run: ' + ', '.join(
+        f'{stage} {human_readable_time(seconds)}' for stage, seconds in timings))
+
+    return FileResponse(sepa_file, as_attachment=True, filename=sepaxml_filename,
+                        content_type='application/xml; charset=utf-8')
 
 
 
@@ -0,0 +1,361 @@
+"""
+Readers for bank statement uploads.
+
+Every reader yields the transactions of a statement shaped like the ones in
+Erste JSON statements (see make_transaction), which is what the bank import
+page works with. The statements are read incrementally from the uploaded
+file, which Django spools to disk when it is large, so only the current
+transaction is held in memory.
+"""
+import codecs
+import csv
+import hashlib
+import json
+import re
+import xml.etree.ElementTree as ET
+from collections import Counter
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+
+def iter_chunks(file, chunk_size=64 * 1024):
+    if hasattr(file, 'chunks'):
+        return file.chunks(chunk_size)
+    return iter(lambda: file.read(chunk_size), b'')
+
+
+def iter_lines(file, chunk_size=64 * 1024):
+    """Yields the lines of the binary ``file``, reading it in chunks."""
+    rest = b''
+    for chunk in iter_chunks(file, chunk_size):
+        lines = (rest + chunk).splitlines(keepends=True)
+        rest = lines.pop() if lines and not lines[-1].endswith((b'\n', b'\r')) else b''
+        yield from lines
+    if rest:
+        yield rest
+
+
+JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+def iter_json_array(file, chunk_size=64 * 1024, max_element_size=1024 * 1024):
+    """
+    Yields the elements of the JSON array in the binary ``file`` one by one.
+    Raises json.JSONDecodeError like json.load if the file is not a JSON
+    array, or if an element is longer than ``max_element_size`` characters.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    chunks = iter_chunks(file, chunk_size)
+    buffer = ''
+    pos = 0
+    eof = False
+
+    def read():
+        nonlocal buffer, pos, eof
+        chunk = next(chunks, None)
+        eof = chunk is None
+        buffer = buffer[pos:] + text_decoder.decode(chunk or b'', final=eof)
+        pos = 0
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            pos = JSON_WHITESPACE.match(buffer, pos).end()
+            if pos < len(buffer) or eof:
+                return
+            read()
+
+    def read_more():
+        # a malformed element must not pull the rest of the file into memory
+        if len(buffer) - pos > max_element_size:
+            raise json.JSONDecodeError("Element too large", buffer, pos)
+        read()
+
+    def expect(chars):
+        nonlocal pos
+        skip_whitespace()
+        if pos >= len(buffer) or buffer[pos] not in chars:
+            raise json.JSONDecodeError(f"Expecting {' or '.join(map(repr, chars))}", buffer, pos)
+        pos += 1
+        return buffer[pos - 1]
+
+    expect('[')
+    skip_whitespace()
+    if buffer[pos:pos + 1] == ']':
+        pos += 1
+    else:
+        while True:
+            skip_whitespace()
+            while True:
+                try:
+                    element, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    read_more()
+                    continue
+                # e.g. a number could continue in the next chunk, so wait
+                # for the following separator
+                separator = JSON_WHITESPACE.match(buffer, end).end()
+                if not eof and buffer[separator:separator + 1] not in (',', ']'):
+                    read_more()
+                    continue
+                break
+            pos = end
+            yield element
+            if expect(',]') == ']':
+                break
+
+    skip_whitespace()
+    if pos < len(buffer):
+        raise json.JSONDecodeError("Extra data", buffer, pos)
+
+
+class BankImportError(Exception):
+    pass
+
+
+def make_transaction(reference_number, booking, partner_name, iban, amount, currency, reference):
+    """
+    Returns a transaction shaped like the ones in Erste JSON statements,
+    which is what the bank import page works with. ``amount`` is a Decimal.
+    """
+    return {
+        "referenceNumber": reference_number,
+        "booking": booking,
+        "partnerName": partner_name,
+        "partnerAccount": {"iban": iban},
+        "amount": {
+            "value": int(amount.scaleb(2).to_integral_value()),
+            "precision": 2,
+            "currency": currency,
+        },
+        "reference": reference,
+        "receiverReference": "",
+    }
+
+
+def make_reference_number(*fields):
+    """Derives a stable reference number for transactions without one."""
+    return hashlib.sha1('\x1f'.join(map(str, fields)).encode()).hexdigest()
+
+
+class ReferenceNumbers:
+    """
+    Derives the reference numbers of the transactions of one statement.
+    Identical transactions, e.g. two equal fees paid on the same day, are
+    told apart by the number of identical ones before them.
+    """
+
+    def __init__(self):
+        self.seen = Counter()
+
+    def __call__(self, *fields):
+        count = self.seen[fields]
+        self.seen[fields] += 1
+        if count:
+            return make_reference_number(*fields, count)
+        return make_reference_number(*fields)
+
+
+def _parse_amount(text):
+    try:
+        amount = Decimal(text)
+    except InvalidOperation:
+        amount = None
+    if amount is None or not amount.is_finite():
+        raise BankImportError(f'invalid amount {text!r}')
+    return amount
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _find(elem, path):
+    """Finds the descendant at the /-separated path of local names."""
+    for name in path.split('/'):
+        if elem is None:
+            return None
+        elem = next((child for child in elem if _local_name(child.tag) == name), None)
+    return elem
+
+
+def _children(elem, name):
+    if elem is None:
+        return []
+    return [child for child in elem if _local_name(child.tag) == name]
+
+
+def _find_text(elem, *paths):
+    for path in paths:
+        found = _find(elem, path)
+        if found is not None and found.text and found.text.strip():
+            return found.text.strip()
+    return ''
+
+
+def _camt053_transactions(entry, reference_numbers):
+    credit = _find_text(entry, 'CdtDbtInd') == 'CRDT'
+    partner = 'Dbtr' if credit else 'Cdtr'
+    booking = _find_text(entry, 'BookgDt/Dt', 'BookgDt/DtTm', 'ValDt/Dt')
+    details = _children(_find(entry, 'NtryDtls'), 'TxDtls') or [None]
+
+    for tx in details:
+        amount_elem = _find(tx, 'Amt')
+        if amount_elem is None:
+            amount_elem = _find(tx, 'AmtDtls/TxAmt/Amt')
+        if amount_elem is None and len(details) == 1:
+            amount_elem = _find(entry, 'Amt')
+        if amount_elem is None or not amount_elem.text:
+            raise BankImportError('camt.053 entry without amount')
+        amount = _parse_amount(amount_elem.text.strip())
+        if not credit:
+            amount = -amount
+
+        partner_name = _find_text(tx, f'RltdPties/{partner}/Nm', f'RltdPties/{partner}/Pty/Nm')
+        iban = _find_text(tx, f'RltdPties/{partner}Acct/Id/IBAN')
+        reference = ' '.join(
+            u.text.strip() for u in _children(_find(tx, 'RmtInf'), 'Ustrd') if u.text
+        ) or _find_text(entry, 'AddtlNtryInf')
+        reference_number = _find_text(tx, 'Refs/AcctSvcrRef') \
+            or (_find_text(entry, 'AcctSvcrRef', 'NtryRef') if len(details) == 1 else '') \
+            or reference_numbers(booking, amount, partner_name, iban, reference)
+
+        yield make_transaction(reference_number, booking, partner_name, iban, amount,
+                               amount_elem.get('Ccy', ''), reference)
+
+
+def iter_camt053(file):
+    """
+    Yields the transactions of an ISO 20022 camt.053 statement. Every entry
+    is removed from the document tree once it has been read.
+    """
+    path = []
+    reference_numbers = ReferenceNumbers()
+    for event, elem in ET.iterparse(file, events=('start', 'end')):
+        if event == 'start':
+            path.append(elem)
+            continue
+
+        path.pop()
+        if _local_name(elem.tag) == 'Ntry':
+            yield from _camt053_transactions(elem, reference_numbers)
+            if path:
+                path[-1].remove(elem)
+
+
+CSV_COLUMNS = {
+    'booking': ['buchungsdatum', 'datum', 'booking date', 'date', 'valuta'],
+    'amount': ['betrag', 'amount'],
+    'currency': ['währung', 'waehrung', 'currency'],
+    'partnerName': ['partnername', 'partner name', 'name', 'auftraggeber', 'empfänger',
+                    'zahlungspflichtiger', 'counterparty'],
+    'iban': ['partner iban', 'partner-iban', 'iban', 'kontonummer'],
+    'reference': ['verwendungszweck', 'zahlungsreferenz', 'reference', 'buchungstext', 'text'],
+    'referenceNumber': ['buchungsreferenz', 'referenznummer', 'reference number',
+                        'transaktions-id', 'transaction id'],
+}
+
+CSV_DATE_FORMATS = ['%Y-%m-%d', '%d.%m.%Y', '%d/%m/%Y', '%d.%m.%y']
+
+
+def _parse_csv_amount(text):
+    text = text.strip().replace(' ', '').replace("'", '')
+    if ',' in text and text.rfind(',') > text.rfind('.'):
+        text = text.replace('.', '').replace(',', '.')
+    else:
+        text = text.replace(',', '')
+    return _parse_amount(text)
+
+
+def _parse_csv_date(text):
+    for date_format in CSV_DATE_FORMATS:
+        try:
+            return datetime.strptime(text.strip(), date_format).date().isoformat()
+        except ValueError:
+            pass
+    raise BankImportError(f'invalid date {text!r}')
+
+
+def iter_csv(file, sample_size=64 * 1024):
+    """
+    Yields the transactions of a CSV statement with a header row. The
+    dialect and the encoding (UTF-8 or Windows-1252) are guessed from the
+    start of the file.
+    """
+    sample = file.read(sample_size)
+    truncated = len(sample) == sample_size
+    file.seek(0)
+    try:
+        # the sample may end in the middle of a character
+        sample = codecs.getincrementaldecoder('utf-8-sig')().decode(sample, final=False)
+        encoding = 'utf-8-sig'
+    except UnicodeDecodeError:
+        encoding = 'cp1252'
+        sample = sample.decode(encoding)
+    if truncated and '\n' in sample:
+        # only sniff complete lines
+        sample = sample[:sample.rindex('\n') + 1]
+
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=';,\t|')
+    except csv.Error:
+        raise BankImportError('could not detect the CSV format')
+
+    lines = codecs.iterdecode(iter_lines(file), encoding)
+    reader = csv.reader(lines, dialect)
+    header = [h.strip().lower() for h in next(reader, [])]
+
+    columns = {}
+    for key, names in CSV_COLUMNS.items():
+        columns[key] = next((header.index(n) for n in names if n in header), None)
+    missing = [key for key in ('booking', 'amount') if columns[key] is None]
+    if missing:
+        raise BankImportError(f'missing CSV columns: {", ".join(missing)}')
+
+    reference_numbers = ReferenceNumbers()
+
+    def get(row, key, default=''):
+        i = columns[key]
+        return row[i].strip() if i is not None and i < len(row) else default
+
+    for row in reader:
+        if not any(row):
+            continue
+
+        booking = _parse_csv_date(get(row, 'booking'))
+        amount = _parse_csv_amount(get(row, 'amount'))
+        partner_name = get(row, 'partnerName')
+        iban = get(row, 'iban')
+        reference = get(row, 'reference')
+        reference_number = get(row, 'referenceNumber') \
+            or reference_numbers(booking, amount, partner_name, iban, reference)
+
+        yield make_transaction(reference_number, booking, partner_name, iban, amount,
+                               get(row, 'currency') or 'EUR', reference)
+
+
+IMPORTERS = {
+    'erste_json': ('Erste Bank JSON', iter_json_array),
+    'camt053': ('ISO 20022 camt.053 XML', iter_camt053),
+    'csv': ('CSV', iter_csv),
+}
+
+
+def read_bank_statement(file, format):
+    """
+    Yields the transactions in the uploaded statement ``file`` of one of
+    the IMPORTERS formats. Raises BankImportError if it can't be read.
+    """
+    try:
+        label, reader = IMPORTERS[format]
+    except KeyError:
+        raise BankImportError(f'unknown format {format!r}')
+
+    try:
+        yield from reader(file)
+    except (ValueError, SyntaxError, csv.Error) as e:
+        # json.JSONDecodeError, ElementTree.ParseError, invalid encodings
+        raise BankImportError(f'could not parse {label} data: {e}') from e
@@ -0,0 +1,154 @@
+"""
+Membership fee ledger.
+
+Instead of walking every month of a membership period and looking up the
+fee for each of them, periods and fee validity intervals are mapped onto
+integer month numbers (see ``get_months``) and intersected. A fee total is
+then one multiplication per overlapping segment.
+
+The charged months are exactly the ones ``get_month_list`` yields for a
+period, including the way ``relativedelta`` clamps a begin date like the
+31st to the end of shorter months.
+"""
+from calendar import monthrange
+from datetime import date
+
+
+class MissingMembershipFee(Exception):
+    pass
+
+
+def get_months(d):
+    return d.month + 12 * d.year
+
+
+def get_year_month(months):
+    return (months - 1) // 12, (months - 1) % 12 + 1
+
+
+def get_charge_date(begin, offset):
+    """
+    Returns the date ``get_month_list(begin, ...)`` yields for the month
+    ``offset`` months after ``begin``.
+    """
+    day = begin.day
+    months = get_months(begin)
+    if day > 28:
+        # get_month_list keeps adding a month to the already clamped date,
+        # so the day sticks to the shortest month passed so far
+        for m in range(months + 1, months + offset + 1):
+            day = min(day, monthrange(*get_year_month(m))[1])
+            if day <= 28:
+                break
+    return date(*get_year_month(months + offset), day)
+
+
+def _first_offset_from(begin, d):
+    """First month offset of a period beginning at ``begin`` charged on or after ``d``."""
+    offset = get_months(d) - get_months(begin)
+    if offset < 0:
+        return 0
+    if get_charge_date(begin, offset) < d:
+        offset += 1
+    return offset
+
+
+def _first_offset_after(begin, d):
+    """First month offset of a period beginning at ``begin`` charged after ``d``."""
+    offset = get_months(d) - get_months(begin)
+    if offset < 0:
+        return 0
+    if get_charge_date(begin, offset) <= d:
+        offset += 1
+    return offset
+
+
+def get_period_month_count(period, today=None):
+    """Number of months ``period`` has been charged for up to ``today``."""
+    today = today or date.today()
+    end = today if period.end is None or period.end >= today else period.end
+    return _first_offset_from(period.begin, end)
+
+
+def get_next_charge_date(period, today=None):
+    """
+    Returns the date of the next month ``period`` will be charged for once
+    it has passed, or None if the period does not accrue any more fees.
+    """
+    today = today or date.today()
+    charge_date = get_charge_date(period.begin, _first_offset_from(period.begin, today))
+    if period.end is not None and charge_date >= period.end:
+        return None
+    return charge_date
+
+
+def find_membership_fee(fees, kind_of_membership_id, month):
+    for fee in fees:
+        if fee.kind_of_membership_id == kind_of_membership_id and fee.start <= month and (fee.end is None or fee.end >= month):
+            return fee
+    return None
+
+
+class FeeSegment:
+    """
+    ``count`` consecutive months of ``period`` charged with ``fee``,
+    starting ``offset`` months after the begin of the period.
+    """
+
+    def __init__(self, period, fee, offset, count):
+        self.period = period
+        self.fee = fee
+        self.offset = offset
+        self.count = count
+
+    @property
+    def total(self):
+        return self.fee.amount * self.count
+
+    def get_months(self):
+        for offset in range(self.offset, self.offset + self.count):
+            yield get_charge_date(self.period.begin, offset)
+
+
+def get_period_segments(period, fees, today=None):
+    """
+    Splits the charged months of ``period`` into FeeSegments, ordered by
+    month. As in MembershipPeriod.get_membership_fee the first matching fee
+    in ``fees`` wins for every month.
+    """
+    begin = period.begin
+    count = get_period_month_count(period, today)
+    uncovered = [(0, count)] if count > 0 else []
+    segments = []
+
+    for fee in fees:
+        if not uncovered:
+            break
+        if fee.kind_of_membership_id != period.kind_of_membership_id:
+            continue
+
+        fee_lo = _first_offset_from(begin, fee.start)
+        fee_hi = None if fee.end is None else _first_offset_after(begin, fee.end)
+
+        remaining = []
+        for lo, hi in uncovered:
+            seg_lo = max(lo, fee_lo)
+            seg_hi = hi if fee_hi is None else min(hi, fee_hi)
+            if seg_lo >= seg_hi:
+                remaining.append((lo, hi))
+                continue
+            segments.append(FeeSegment(period, fee, seg_lo, seg_hi - seg_lo))
+            remaining.append((lo, seg_lo))
+            remaining.append((seg_hi, hi))
+        uncovered = [(lo, hi) for lo, hi in remaining if lo < hi]
+
+    if uncovered:
+        month = get_charge_date(begin, min(lo for lo, hi in uncovered))
+        raise MissingMembershipFee(f"could not find a membership fee for month {month} and kind of membership {period.kind_of_membership}")
+
+    segments.sort(key=lambda s: s.offset)
+    return segments
+
+
+def get_fees_total(segments):
+    return sum(s.total for s in segments if s.fee.amount > 0)
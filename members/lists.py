@@ -0,0 +1,147 @@
+"""
+Plain text member lists polled by machines: the keys for the door system
+(keylist), the laser cutter (lazzzorlist) and the addresses for the
+mailing list tooling (internlist).
+
+Every list is built with one query and cached as text with its ETag until
+a user, contact info or membership period changes (see members.signals).
+Who is a member depends on the date, so the cache key contains it.
+
+The door controller can fetch only the keys added and removed since the
+version it has (see get_key_list_delta). The changes are logged in
+KeyListChange whenever the cached key list version is rebuilt, so they are
+derived from the same edits and date rollovers that change the keylist.
+"""
+from datetime import date
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+
+from core.cache import bump_data_version, get_data_version, make_etag
+from .models import KeyListChange, get_active_and_future_members, get_mailinglist_members
+
+MEMBER_LIST_KEY = 'members.list.%s.%s.%s'
+MEMBER_LIST_TIMEOUT = 24 * 60 * 60
+# clients missing more changes get the whole key list
+KEY_LIST_DELTA_LIMIT = 100
+
+
+def get_key_members():
+    # active members with active keys
+    return get_active_and_future_members().filter(contactinfo__has_active_key=True) \
+        .filter(contactinfo__key_id__isnull=False)
+
+
+def build_key_list():
+    # one key per line
+    members = get_key_members().select_related('contactinfo')
+    return '\r\n'.join(m.contactinfo.key_id for m in members)
+
+
+def build_lazzzor_list():
+    # key id, username and rate of members with lazzzor privileges
+    members = get_active_and_future_members().filter(contactinfo__has_lazzzor_privileges=True) \
+        .filter(contactinfo__key_id__isnull=False).select_related('contactinfo')
+    return '\r\n'.join('%s,%s,%s' % (m.contactinfo.key_id, m.username, m.contactinfo.lazzzor_rate)
+                       for m in members)
+
+
+def build_intern_list():
+    members = get_mailinglist_members().filter(contactinfo__on_intern_list=True) \
+        .exclude(contactinfo__intern_list_email='').select_related('contactinfo')
+    return '\r\n'.join(m.contactinfo.intern_list_email for m in members)
+
+
+MEMBER_LISTS = {
+    'keylist': build_key_list,
+    'lazzzorlist': build_lazzzor_list,
+    'internlist': build_intern_list,
+}
+
+
+def get_member_list_key(name):
+    return MEMBER_LIST_KEY % (name, get_data_version('member_lists'), date.today().isoformat())
+
+
+def get_cached_member_list(name):
+    """Returns the cached (text, etag) of the list or None, without a query."""
+    return cache.get(get_member_list_key(name))
+
+
+def get_member_list(name):
+    """Returns the (text, etag) of the list, building it if needed."""
+    key = get_member_list_key(name)
+    member_list = cache.get(key)
+    if member_list is None:
+        text = MEMBER_LISTS[name]().encode()
+        member_list = (text, make_etag(text))
+        cache.set(key, member_list, MEMBER_LIST_TIMEOUT)
+    return member_list
+
+
+def invalidate_member_lists():
+    bump_data_version('member_lists')
+
+
+def get_logged_keys(version):
+    """Returns the keys on the key list at ``version`` of the change log."""
+    latest = KeyListChange.objects.filter(pk__lte=version) \
+        .values('key_id').annotate(last=Max('pk')).values('last')
+    return set(KeyListChange.objects.filter(pk__in=latest, added=True)
+               .values_list('key_id', flat=True))
+
+
+def sync_key_list_changes():
+    """
+    Logs the keys added to and removed from the key list since the last
+    sync and returns the version of the key list.
+    """
+    with transaction.atomic():
+        version = KeyListChange.objects.aggregate(version=Max('pk'))['version'] or 0
+        logged = get_logged_keys(version)
+        keys = set(get_key_members().values_list('contactinfo__key_id', flat=True))
+        changes = [KeyListChange(key_id=key, added=False) for key in sorted(logged - keys)] + \
+                  [KeyListChange(key_id=key, added=True) for key in sorted(keys - logged)]
+        for change in changes:
+            change.save()
+        return changes[-1].pk if changes else version
+
+
+def get_cached_key_list_version():
+    """Returns the cached version of the key list or None, without a query."""
+    return cache.get(get_member_list_key('keylist.version'))
+
+
+def get_key_list_version():
+    version = get_cached_key_list_version()
+    if version is None:
+        version = sync_key_list_changes()
+        cache.set(get_member_list_key('keylist.version'), version, MEMBER_LIST_TIMEOUT)
+    return version
+
+
+def get_key_list_delta(since=None):
+    """
+    Returns the keys added and removed since version ``since`` of the key
+    list. Clients without a known version, or which miss more than
+    KEY_LIST_DELTA_LIMIT changes, get the whole key list as a snapshot.
+    """
+    version = get_key_list_version()
+    if since == version:
+        return {'version': version, 'snapshot': False, 'add': [], 'remove': []}
+
+    if since is not None and 0 <= since < version:
+        changes = KeyListChange.objects.filter(pk__gt=since, pk__lte=version) \
+            .order_by('pk').values_list('key_id', 'added')[:KEY_LIST_DELTA_LIMIT + 1]
+        if len(changes) <= KEY_LIST_DELTA_LIMIT:
+            # only the last change of a key counts
+            latest = dict(changes)
+            return {
+                'version': version,
+                'snapshot': False,
+                'add': sorted(key for key, added in latest.items() if added),
+                'remove': sorted(key for key, added in latest.items() if not added),
+            }
+
+    return {'version': version, 'snapshot': True, 'keys': sorted(get_logged_keys(version))}
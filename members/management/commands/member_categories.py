@@ -1,11 +1,9 @@
 from django.core.management.base import LabelCommand
-from django.core.exceptions import MultipleObjectsReturned
-from django.contrib.auth import get_user_model
-from django.db.models import Q
 
 from datetime import date
 
-from ...models import get_active_members_for
+from ...models import KindOfMembership
+from ...snapshots import get_membership_snapshots
 
 from collections import defaultdict
 
@@ -16,30 +14,27 @@ class Command(LabelCommand):
     def handle_label(self, label, **options):
         year = int(label)
 
+        months = [date(year, month, 1) for month in range(1, 13)]
+        snapshots = get_membership_snapshots(months)
+        kinds = KindOfMembership.objects.in_bulk()
+
         print(f'Mitgliedskategorien je Monat im Jahr {year}:')
-        for month in range(1, 13):
-            dt = date(year, month, 1)
-            data_dict, sum_users = self.handle_date(dt)
+        for dt in months:
+            data_dict, sum_users = self.handle_snapshot(snapshots[dt], kinds)
             print(dt.strftime('%m/%Y'), 'Member in Summe:', sum_users)
             for key, value in data_dict.items():
                 print(key, value)
 
         print("\n")
 
-    def handle_date(self, dt):
+    def handle_snapshot(self, snapshot, kinds):
         member_category_dict = defaultdict(int)
         user_sum = 0
-        for user in get_active_members_for(dt):
-            # we have to get first() because the last day of one period
-            # may be the same as the first day of the next period.
-            # this shouldn't happen, but oh well...
-            # also get_active_members_for uses begin <= dt <= end
-            period = user.membershipperiod_set.filter(
-                    Q(begin__lte=dt),
-                    Q(end__isnull=True) | Q(end__gte=dt)
-            ).first()
-
-            member_category_dict[period.kind_of_membership.name] += 1
-            user_sum += 1
+        # members are counted by the kind of their first active period,
+        # the last day of one period may be the first day of the next.
+        for row in snapshot.kind_rows:
+            if row.members > 0:
+                member_category_dict[kinds[row.kind_of_membership_id].name] += row.members
+                user_sum += row.members
 
         return member_category_dict, user_sum
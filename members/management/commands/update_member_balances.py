@@ -0,0 +1,54 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ...ledger import MissingMembershipFee
+from ...models import ContactInfo, MemberBalance, update_member_balances
+
+
+class Command(BaseCommand):
+    help = 'Update the materialized member balances, run this nightly'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='recompute all balances from scratch')
+        parser.add_argument('--verify', action='store_true',
+                            help='compare all balances with ContactInfo.get_debts')
+
+    def handle(self, rebuild=False, verify=False, *args, **options):
+        with transaction.atomic():
+            if rebuild:
+                balances = update_member_balances()
+            else:
+                # balances for which a monthly fee became due since the
+                # last update, i.e. the month rolled over for that member
+                outdated = MemberBalance.objects.filter(
+                    valid_until__lte=date.today(),
+                ).values_list('user_id', flat=True)
+                balances = update_member_balances(outdated)
+            self.stdout.write(f'updated {len(balances)} balances')
+
+        if verify:
+            self.verify()
+
+    def verify(self):
+        balances = {b.user_id: b for b in MemberBalance.objects.all()}
+        mismatches = 0
+
+        for info in ContactInfo.objects.select_related('user'):
+            try:
+                expected = info.get_debts()
+            except MissingMembershipFee as ex:
+                mismatches += 1
+                self.stderr.write(f'{info.user.username}: {ex}')
+                continue
+            balance = balances.get(info.user_id)
+            actual = balance.debts if balance else 0
+            if abs(expected - actual) > 0.005:
+                mismatches += 1
+                self.stderr.write(f'{info.user.username}: expected {expected}, got {actual}')
+
+        if mismatches:
+            raise CommandError(f'{mismatches} balances do not match')
+        self.stdout.write('all balances match')
@@ -0,0 +1,19 @@
+from datetime import date
+
+from dateutil.rrule import rrule, MONTHLY
+from django.core.management.base import BaseCommand
+
+from ...snapshots import get_first_of_month, get_membership_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Store the membership snapshots of all closed months, run this nightly'
+
+    def handle(self, *args, **options):
+        months = [
+            dt.date()
+            for dt in rrule(MONTHLY, dtstart=date(2006, 3, 1), until=get_first_of_month())
+            if dt.date() < get_first_of_month()
+        ]
+        get_membership_snapshots(months)
+        self.stdout.write(f'{len(months)} closed months are stored')
@@ -0,0 +1,126 @@
+"""
+Matching of bank import transactions against the BankImportMatchers and the
+members' bank accounts.
+
+All matcher strings are compiled into one Aho–Corasick automaton, so a
+transaction is scanned once no matter how many matchers there are. The
+compiled rules are cached until a matcher changes (see members.signals).
+"""
+import re
+from collections import defaultdict, deque, namedtuple
+
+from django.core.cache import cache
+
+from .models import BankImportMatcher, Payment, PaymentInfo
+
+
+class Automaton:
+    """Aho–Corasick automaton finding which of the patterns occur in a text."""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+
+        for i, pattern in enumerate(patterns):
+            state = 0
+            for char in pattern:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                    self.goto[state][char] = next_state
+                state = next_state
+            self.out[state].append(i)
+
+        # the empty pattern occurs in every text, it is reported by find
+        # directly instead of being inherited by every state
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                fail = self.goto[fail].get(char, 0)
+                self.fail[next_state] = fail
+                if fail:
+                    self.out[next_state] = self.out[next_state] + self.out[fail]
+
+    def find(self, text, found=None):
+        """Adds the indices of the patterns occurring in text to the set found."""
+        if found is None:
+            found = set()
+        found.update(self.out[0])
+
+        goto, fail, out = self.goto, self.fail, self.out
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+
+BankImportRule = namedtuple('BankImportRule', ['action', 'color', 'member_id'])
+
+
+class BankImportRules:
+    def __init__(self, matchers):
+        matchers = list(matchers)
+        self.rules = [BankImportRule(m.action, m.color, m.member_id) for m in matchers]
+        self.automaton = Automaton([m.matcher for m in matchers])
+
+    @property
+    def member_ids(self):
+        return {rule.member_id for rule in self.rules if rule.member_id is not None}
+
+    def match(self, fields):
+        """Returns the rules matching any of the fields, in matcher order."""
+        found = set()
+        for field in fields:
+            self.automaton.find(field, found)
+        return [self.rules[i] for i in sorted(found)]
+
+
+RULES_CACHE_KEY = 'members.bank_import_rules'
+
+
+def get_bank_import_rules():
+    rules = cache.get(RULES_CACHE_KEY)
+    if rules is None:
+        rules = BankImportRules(BankImportMatcher.objects.order_by('pk'))
+        cache.set(RULES_CACHE_KEY, rules, None)
+    return rules
+
+
+def invalidate_bank_import_rules():
+    cache.delete(RULES_CACHE_KEY)
+
+
+def normalize_iban(iban):
+    return re.sub(r'\s+', '', iban or '').upper()
+
+
+def get_members_by_iban():
+    """Returns a dict normalized IBAN -> list of users with that bank account."""
+    members = defaultdict(list)
+    for payment_info in PaymentInfo.objects.exclude(bank_account_iban='') \
+            .select_related('user').order_by('user_id'):
+        members[normalize_iban(payment_info.bank_account_iban)].append(payment_info.user)
+    return members
+
+
+def get_imported_references(references, batch_size=500):
+    """Returns the set of references which already are a Payment's original_line."""
+    references = list({str(r) for r in references})
+    imported = set()
+    for i in range(0, len(references), batch_size):
+        imported.update(Payment.objects.filter(original_line__in=references[i:i + batch_size])
+                        .values_list('original_line', flat=True))
+    return imported
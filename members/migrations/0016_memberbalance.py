@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:49
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('members', '0015_auto_20230709_2031'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MemberBalance',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fees', models.IntegerField(default=0)),
+                ('payments', models.FloatField(default=0)),
+                ('debts', models.FloatField(default=0)),
+                ('valid_until', models.DateField(blank=True, db_index=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
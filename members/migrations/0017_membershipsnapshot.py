@@ -0,0 +1,35 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0016_memberbalance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MembershipSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True)),
+                ('num_member', models.IntegerField()),
+                ('new_member', models.IntegerField()),
+                ('resigned_member', models.IntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MembershipSnapshotKind',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periods', models.IntegerField()),
+                ('members', models.IntegerField()),
+                ('fees', models.IntegerField(blank=True, null=True)),
+                ('kind_of_membership', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='members.kindofmembership')),
+                ('snapshot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='kinds', to='members.membershipsnapshot')),
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+INDEX_NAME = 'members_payment_original_line_idx'
+
+
+def create_index(apps, schema_editor):
+    quote = schema_editor.quote_name
+    column = quote('original_line')
+    if schema_editor.connection.vendor == 'mysql':
+        # MySQL can only index a prefix of TEXT columns
+        column += '(64)'
+    schema_editor.execute(
+        f'CREATE INDEX {quote(INDEX_NAME)} ON {quote("members_payment")} ({column})')
+
+
+def drop_index(apps, schema_editor):
+    quote = schema_editor.quote_name
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute(f'DROP INDEX {quote(INDEX_NAME)} ON {quote("members_payment")}')
+    else:
+        schema_editor.execute(f'DROP INDEX {quote(INDEX_NAME)}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0017_membershipsnapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
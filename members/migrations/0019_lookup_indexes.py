@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:10
+
+from django.db import migrations, models
+import members.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0018_payment_original_line_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='paymentinfo',
+            name='bank_account_iban',
+            field=models.CharField(blank=True, db_index=True, max_length=34, validators=[members.models.iban_validate]),
+        ),
+        migrations.AddIndex(
+            model_name='membershipperiod',
+            index=models.Index(fields=['user', 'begin', 'end'], name='members_period_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='membershipperiod',
+            index=models.Index(fields=['begin', 'end'], name='members_period_range_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['user', 'date'], name='members_payment_user_date_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0019_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KeyListChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key_id', models.CharField(db_index=True, max_length=15)),
+                ('added', models.BooleanField()),
+                ('changed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -1,8 +1,8 @@
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from operator import mod
 from dateutil.relativedelta import relativedelta
 from decimal import Decimal
-from django.db.models import Sum
+from django.db.models import Min, Sum
 
 from django.db import models
 from django.db.models import Q
@@ -16,6 +16,9 @@ from django.core.validators import RegexValidator
 
 from easy_thumbnails.fields import ThumbnailerImageField
 
+from .ledger import MissingMembershipFee, get_months, get_period_segments, \
+    get_fees_total, get_next_charge_date, find_membership_fee
+
 import string
 from django.core.exceptions import ValidationError
 
@@ -160,7 +163,7 @@ class PaymentInfo(models.Model):
     bank_account_number = models.CharField(max_length=20, blank=True)
     bank_name = models.CharField(max_length=100, blank=True)
     bank_code = models.CharField(max_length=20, blank=True)
-    bank_account_iban = models.CharField(max_length=34, blank=True, validators=[iban_validate])
+    bank_account_iban = models.CharField(max_length=34, blank=True, validators=[iban_validate], db_index=True)
     bank_account_bic = models.CharField(max_length=11, blank=True)
     bank_account_mandate_reference = models.CharField(max_length=35, blank=True)
     bank_account_date_of_signing = models.DateField(null=True, blank=True)
@@ -212,20 +215,30 @@ class ContactInfo(models.Model):
                                        max_digits=3, decimal_places=2)
     remark = models.TextField(null=True, blank=True)
 
-    def get_membership_fees(self):
+    def get_membership_fee_segments(self):
         mp_list = MembershipPeriod.objects.filter(user=self.user)
         fees = list(MembershipFee.objects.all())
 
         for mp in mp_list:
-            for month in mp.get_months():
-                fee = mp.get_membership_fee(month, fees)
-                if fee.amount > 0:
-                    yield (month, fee.amount)
+            yield from get_period_segments(mp, fees)
+
+    def get_membership_fees(self):
+        for segment in self.get_membership_fee_segments():
+            if segment.fee.amount > 0:
+                for month in segment.get_months():
+                    yield (month, segment.fee.amount)
 
     def get_debts(self):
-        arrears = sum(f[1] for f in self.get_membership_fees())
+        arrears = get_fees_total(self.get_membership_fee_segments())
         return arrears - self.get_all_payments()
 
+    def get_cached_debts(self):
+        balance = get_member_balances([self.user_id]).get(self.user_id)
+        if balance is None:
+            # the balance could not be computed, let get_debts raise why
+            return self.get_debts()
+        return balance.debts
+
     def get_debts_detailed(self):
         fees = ({"date": f[0], "amount": -f[1], "kind": "membership fee"} for f in self.get_membership_fees())
         payments = ({"date": p.date, "amount": p.amount, "kind": p.method.name} for p in Payment.objects.filter(user=self.user))
@@ -335,10 +348,6 @@ def get_active_membership_months_until(date):
     return res
 
 
-def get_months(date):
-    return date.month + 12 * date.year
-
-
 class BankCollectionMode(models.Model):
     name = models.CharField(max_length=20)
     num_month = models.IntegerField()
@@ -368,6 +377,12 @@ class MembershipPeriod(models.Model):
         on_delete=models.CASCADE,
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'begin', 'end'], name='members_period_user_idx'),
+            models.Index(fields=['begin', 'end'], name='members_period_range_idx'),
+        ]
+
     def __str__(self):
         return self.user.username
 
@@ -394,10 +409,10 @@ class MembershipPeriod(models.Model):
     def get_membership_fee(self, month, fees=None):
         if fees is None:
             fees = list(MembershipFee.objects.all())
-        for fee in fees:
-            if fee.kind_of_membership_id == self.kind_of_membership_id and fee.start <= month and (fee.end is None or fee.end >= month):
-                return fee
-        raise Exception(f"could not find a membership fee for month {month} and kind of membership {self.kind_of_membership}")
+        fee = find_membership_fee(fees, self.kind_of_membership_id, month)
+        if fee is not None:
+            return fee
+        raise MissingMembershipFee(f"could not find a membership fee for month {month} and kind of membership {self.kind_of_membership}")
 
     def get_months(self):
         return get_month_list(self.begin, self.end)
@@ -490,6 +505,11 @@ class Payment(AbstractPayment):
     original_line = models.TextField(blank=True)
     original_lineno = models.IntegerField(blank=True, null=True)
 
+    class Meta(AbstractPayment.Meta):
+        indexes = [
+            models.Index(fields=['user', 'date'], name='members_payment_user_date_idx'),
+        ]
+
 
 class MailinglistMail(models.Model):
     email = models.EmailField()
@@ -522,3 +542,213 @@ class BankImportMatcher(models.Model):
     action = models.CharField(choices=MATCHER_CHOICES, max_length=20)
     color = models.CharField(max_length=100, null=True, blank=True, help_text="if action=color, e.g. 'red' or 'rgba(255,0,0,0.1)'")
     member = models.ForeignKey(User, null=True, blank=True, on_delete=models.CASCADE, help_text="if action=match_to")
+
+
+class MemberBalance(models.Model):
+    """
+    Materialized result of ContactInfo.get_debts. Kept up to date by the
+    signal handlers in members.signals and by the update_member_balances
+    management command, which is supposed to run nightly.
+    """
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+    )
+    fees = models.IntegerField(default=0)
+    payments = models.FloatField(default=0)
+    debts = models.FloatField(default=0)
+    # the day the next monthly fee becomes due, None if there is none
+    valid_until = models.DateField(null=True, blank=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return "%s: %.2f" % (self.user.username, self.debts)
+
+
+def update_member_balances(user_ids=None, today=None):
+    """
+    Recomputes the MemberBalance of the given users, or of everyone with a
+    membership period or payment if user_ids is None, using a fixed number
+    of queries. Users whose fees cannot be computed get no balance.
+    Returns a dict user id -> MemberBalance.
+    """
+    today = today or date.today()
+
+    periods = MembershipPeriod.objects.all()
+    payments = Payment.objects.filter(user__isnull=False)
+    if user_ids is not None:
+        user_ids = set(user_ids)
+        periods = periods.filter(user_id__in=user_ids)
+        payments = payments.filter(user_id__in=user_ids)
+    fees = list(MembershipFee.objects.all())
+
+    balances = {
+        user_id: MemberBalance(user_id=user_id)
+        for user_id in (user_ids or ())
+    }
+    failed = set()
+
+    for mp in periods:
+        balance = balances.setdefault(mp.user_id, MemberBalance(user_id=mp.user_id))
+        try:
+            balance.fees += get_fees_total(get_period_segments(mp, fees, today))
+        except MissingMembershipFee:
+            failed.add(mp.user_id)
+
+        charge_date = get_next_charge_date(mp, today)
+        if charge_date is not None:
+            due = charge_date + timedelta(days=1)
+            if balance.valid_until is None or due < balance.valid_until:
+                balance.valid_until = due
+
+    for user_id, amount in payments.order_by().values('user_id') \
+            .annotate(amount=Sum('amount')).values_list('user_id', 'amount'):
+        balances.setdefault(user_id, MemberBalance(user_id=user_id)).payments = amount or 0
+
+    for user_id in failed:
+        del balances[user_id]
+    for balance in balances.values():
+        balance.debts = balance.fees - balance.payments
+
+    existing = MemberBalance.objects.all()
+    if user_ids is not None:
+        existing = existing.filter(user_id__in=user_ids)
+    existing = dict(existing.values_list('user_id', 'pk'))
+
+    MemberBalance.objects.filter(pk__in=[
+        pk for user_id, pk in existing.items() if user_id not in balances
+    ]).delete()
+
+    for balance in balances.values():
+        balance.pk = existing.get(balance.user_id)
+        balance.updated_at = datetime.now()
+    MemberBalance.objects.bulk_update(
+        [b for b in balances.values() if b.pk is not None],
+        ['fees', 'payments', 'debts', 'valid_until', 'updated_at'],
+    )
+    MemberBalance.objects.bulk_create(
+        [b for b in balances.values() if b.pk is None]
+    )
+
+    return balances
+
+
+def get_member_balances(user_ids, today=None):
+    """
+    Returns a dict user id -> MemberBalance for the given users, recomputing
+    the balances which are missing or outdated.
+    """
+    today = today or date.today()
+    balances = {
+        b.user_id: b
+        for b in MemberBalance.objects.filter(user_id__in=user_ids).filter(
+            Q(valid_until__isnull=True) | Q(valid_until__gt=today))
+    }
+    outdated = set(user_ids) - set(balances)
+    if outdated:
+        balances.update(update_member_balances(outdated, today))
+    return balances
+
+
+def get_monthly_fees(user_ids, date_in_month, skip_missing=False):
+    """
+    Returns a dict user id -> what ContactInfo.get_debt_for_month returns
+    for ``date_in_month``, using two queries for all users. With
+    ``skip_missing``, users without a matching membership fee are left out
+    instead of raising MissingMembershipFee.
+    """
+    periods = MembershipPeriod.objects.filter(
+        Q(begin__lte=date_in_month),
+        Q(end__isnull=True) | Q(end__gte=date_in_month),
+        user_id__in=user_ids,
+    ).order_by('pk')
+    fees = list(MembershipFee.objects.order_by('pk'))
+
+    monthly_fees = {user_id: 0 for user_id in user_ids}
+    seen = set()
+    for mp in periods:
+        if mp.user_id not in seen:
+            seen.add(mp.user_id)
+            try:
+                monthly_fees[mp.user_id] = mp.get_membership_fee(date_in_month, fees).amount
+            except MissingMembershipFee:
+                if not skip_missing:
+                    raise
+                del monthly_fees[mp.user_id]
+    return monthly_fees
+
+
+def annotate_member_debts(users, today=None):
+    """
+    Computes what ContactInfo.get_date_of_first_join, get_debt_for_month and
+    get_cached_debts return for every user in ``users`` with a fixed number
+    of queries, and sets them as ``date_of_first_join``, ``monthly_fee``
+    and ``debts`` attributes. Returns the users as list.
+    """
+    today = today or date.today()
+    users = list(users)
+    user_ids = [u.pk for u in users]
+
+    first_joins = dict(
+        MembershipPeriod.objects.filter(user_id__in=user_ids).order_by()
+        .values('user_id').annotate(first_join=Min('begin'))
+        .values_list('user_id', 'first_join')
+    )
+    monthly_fees = get_monthly_fees(user_ids, today)
+    balances = get_member_balances(user_ids, today)
+
+    for user in users:
+        user.date_of_first_join = first_joins.get(user.pk)
+        user.monthly_fee = monthly_fees[user.pk]
+
+        balance = balances.get(user.pk)
+        user.debts = balance.debts if balance else None
+
+    return users
+
+
+class MembershipSnapshot(models.Model):
+    """
+    Membership figures of a closed month, see members.snapshots.
+    """
+
+    month = models.DateField(unique=True)
+    num_member = models.IntegerField()
+    new_member = models.IntegerField()
+    resigned_member = models.IntegerField()
+
+    def __str__(self):
+        return self.month.strftime('%Y-%m')
+
+
+class MembershipSnapshotKind(models.Model):
+    snapshot = models.ForeignKey(
+        MembershipSnapshot,
+        on_delete=models.CASCADE,
+        related_name='kinds',
+    )
+    kind_of_membership = models.ForeignKey(
+        KindOfMembership,
+        on_delete=models.CASCADE,
+    )
+    # periods active on the first of the month
+    periods = models.IntegerField()
+    # members, counted by the kind of their first active period
+    members = models.IntegerField()
+    # None if there is no membership fee for the kind in this month
+    fees = models.IntegerField(null=True, blank=True)
+
+
+class KeyListChange(models.Model):
+    """
+    A key added to or removed from the key list, see members.lists. The pk
+    is the version of the key list after the change.
+    """
+
+    key_id = models.CharField(max_length=15, db_index=True)
+    added = models.BooleanField()
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return '%s%s' % ('+' if self.added else '-', self.key_id)
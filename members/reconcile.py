@@ -0,0 +1,189 @@
+"""
+Suggests the member a bank transaction is from.
+
+Every piece of evidence gives a candidate member a score between 0 and 1,
+the scores are combined with a noisy-or, so independent evidence adds up
+without exceeding 1:
+
+* the "(u<id>)" token generate_sepa writes into the descriptions, e.g. of
+  returned direct debits
+* the IBAN of the member's bank account
+* the same text as an earlier payment of the member (standing orders)
+* the sender's name compared to the member's name and account owner
+* the member's name in the text
+* the amount being a multiple of the member's monthly fee, which only
+  strengthens candidates found otherwise
+
+All lookups go through indexes built once by Reconciler.build, so scoring a
+transaction doesn't query the database.
+"""
+import heapq
+import re
+import unicodedata
+from collections import Counter, defaultdict, namedtuple
+from datetime import date
+
+from dateutil.relativedelta import relativedelta
+from django.contrib.auth.models import User
+
+from .matching import get_members_by_iban, normalize_iban
+from .models import Payment, get_monthly_fees
+
+SEPA_TOKEN = re.compile(r'\(u(\d+)\)')
+GERMAN_LETTERS = str.maketrans({'ä': 'ae', 'ö': 'oe', 'ü': 'ue', 'ß': 'ss'})
+
+# comments shared by more members than this say nothing about the sender
+MAX_MEMBERS_PER_COMMENT = 3
+
+
+def get_name_tokens(text):
+    text = unicodedata.normalize('NFKD', (text or '').lower().translate(GERMAN_LETTERS))
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return {token for token in re.split(r'[^a-z0-9]+', text) if len(token) > 1}
+
+
+def normalize_text(text):
+    return ' '.join((text or '').lower().split())
+
+
+Candidate = namedtuple('Candidate', ['user', 'score', 'reasons'])
+
+
+class Reconciler:
+    SEPA_TOKEN_SCORE = 0.95
+    IBAN_SCORE = 0.9
+    HISTORY_SCORE = 0.75
+    NAME_SCORE = 0.8
+    NAME_IN_TEXT_SCORE = 0.6
+    AMOUNT_SCORE = 0.3
+    # e.g. one of two names
+    MIN_NAME_SIMILARITY = 0.5
+
+    CONFIDENT_SCORE = 0.8
+    CONFIDENT_MARGIN = 0.2
+
+    def __init__(self, users, members_by_iban, comments, monthly_fees):
+        """
+        users: dict user id -> User
+        members_by_iban: dict normalized IBAN -> list of users
+        comments: iterable of (user id, payment comment)
+        monthly_fees: dict user id -> monthly fee
+        """
+        self.users = users
+        self.monthly_fees = monthly_fees
+        self.by_iban = {
+            iban: [u.pk for u in iban_users] for iban, iban_users in members_by_iban.items()
+        }
+
+        by_comment = defaultdict(set)
+        for user_id, comment in comments:
+            comment = normalize_text(comment)
+            if comment and user_id in users:
+                by_comment[comment].add(user_id)
+        self.by_comment = {
+            comment: user_ids for comment, user_ids in by_comment.items()
+            if len(user_ids) <= MAX_MEMBERS_PER_COMMENT
+        }
+
+        self.name_tokens = {}
+        self.by_name_token = defaultdict(set)
+        for user in users.values():
+            tokens = get_name_tokens(f'{user.first_name} {user.last_name}')
+            self.name_tokens[user.pk] = tokens
+            for token in tokens:
+                self.by_name_token[token].add(user.pk)
+
+        self.owner_tokens = {}
+        self.by_owner_token = defaultdict(set)
+        for iban_users in members_by_iban.values():
+            for user in iban_users:
+                # get_members_by_iban loads the users with their payment info
+                tokens = get_name_tokens(user.paymentinfo.bank_account_owner)
+                self.owner_tokens[user.pk] = tokens
+                for token in tokens:
+                    self.by_owner_token[token].add(user.pk)
+
+    @classmethod
+    def build(cls, today=None):
+        """Builds the indexes for all members with a fixed number of queries."""
+        today = today or date.today()
+        users = User.objects.filter(membershipperiod__isnull=False).distinct().in_bulk()
+        members_by_iban = get_members_by_iban()
+        for iban_users in members_by_iban.values():
+            for user in iban_users:
+                users.setdefault(user.pk, user)
+        comments = Payment.objects.filter(
+            user_id__isnull=False,
+            date__gte=today - relativedelta(years=2),
+        ).exclude(comment='').order_by().values_list('user_id', 'comment').distinct()
+        # a kind of membership without a fee must not break the import, the
+        # member just gets no amount signal
+        monthly_fees = get_monthly_fees(list(users), today, skip_missing=True)
+        return cls(users, members_by_iban, comments, monthly_fees)
+
+    def score(self, payment, limit=5):
+        """
+        Returns the best candidates for a transaction (see
+        members.importers), best first.
+        """
+        scores = defaultdict(float)
+        reasons = defaultdict(list)
+
+        def add(user_id, score, reason):
+            if user_id in self.users and score > 0:
+                scores[user_id] = 1 - (1 - scores[user_id]) * (1 - score)
+                reasons[user_id].append(reason)
+
+        text = payment.get("text") or (payment["reference"] + " " + payment["receiverReference"])
+
+        for match in SEPA_TOKEN.finditer(text):
+            add(int(match.group(1)), self.SEPA_TOKEN_SCORE, 'SEPA reference')
+
+        for user_id in self.by_iban.get(normalize_iban(payment["partnerAccount"]["iban"]), ()):
+            add(user_id, self.IBAN_SCORE, 'IBAN')
+
+        for user_id in self.by_comment.get(normalize_text(text), ()):
+            add(user_id, self.HISTORY_SCORE, 'earlier payment')
+
+        # the number of shared tokens of every member with a shared token
+        partner_tokens = get_name_tokens(payment["partnerName"])
+        similarity = defaultdict(float)
+        for tokens, index in ((self.name_tokens, self.by_name_token),
+                              (self.owner_tokens, self.by_owner_token)):
+            shared = count_shared_tokens(partner_tokens, index)
+            for user_id, count in shared.items():
+                similarity[user_id] = max(
+                    similarity[user_id],
+                    2 * count / (len(partner_tokens) + len(tokens[user_id])),
+                )
+        for user_id, value in similarity.items():
+            if value >= self.MIN_NAME_SIMILARITY:
+                add(user_id, self.NAME_SCORE * value, 'name')
+
+        shared = count_shared_tokens(get_name_tokens(text), self.by_name_token)
+        for user_id, count in shared.items():
+            if count > 1 and count == len(self.name_tokens[user_id]):
+                add(user_id, self.NAME_IN_TEXT_SCORE, 'name in text')
+
+        amount = payment["amount"]["value"] / pow(10, payment["amount"]["precision"])
+        for user_id in list(scores):
+            fee = self.monthly_fees.get(user_id)
+            if fee and amount > 0 and amount % fee == 0 and amount / fee <= 12:
+                add(user_id, self.AMOUNT_SCORE, 'amount')
+
+        best = heapq.nsmallest(limit, scores, key=lambda user_id: (-scores[user_id], user_id))
+        return [Candidate(self.users[user_id], scores[user_id], reasons[user_id]) for user_id in best]
+
+    def is_confident(self, candidates):
+        if not candidates or candidates[0].score < self.CONFIDENT_SCORE:
+            return False
+        return len(candidates) == 1 or \
+            candidates[0].score - candidates[1].score >= self.CONFIDENT_MARGIN
+
+
+def count_shared_tokens(tokens, index):
+    """Returns a Counter user id -> number of the tokens in the user's entry of index."""
+    shared = Counter()
+    for token in tokens:
+        shared.update(index.get(token, ()))
+    return shared
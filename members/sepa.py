@@ -0,0 +1,130 @@
+"""
+Streaming export of SEPA direct debits (pain.008).
+
+SepaDDStream accepts the same payments as sepaxml's SepaDD and produces
+byte-identical output, but it only keeps the payment dicts and the control
+sums until the export. The document is then serialized one transaction at a
+time by iter_export, using SepaDD's own code to build the XML nodes.
+"""
+import os
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+
+import sepaxml
+from sepaxml import SepaDD
+from sepaxml.utils import int_to_decimal_str, make_id
+from sepaxml.validation import ValidationError, try_valid_xml
+
+
+class SepaDDStream(SepaDD):
+    def __init__(self, config, schema="pain.008.001.02", clean=True):
+        super().__init__(config, schema, clean)
+        self._payments = OrderedDict()  # batch key -> payment dicts
+        self._nb_of_txs = 0
+        self._ctrl_sum = 0
+        self._tx_nodes = []
+
+    def add_payment(self, payment):
+        # check_payment replaces the dates by strings, so check a copy
+        payment = dict(payment)
+        self.check_payment(dict(payment))
+
+        if self._config['batch']:
+            # SepaDD creates the end to end ids when adding the payments and
+            # the payment information ids when exporting
+            if not payment.get('endtoend_id', ''):
+                payment['endtoend_id'] = make_id(self._config['name'])
+            key = payment['type'] + "::" + str(payment['collection_date'])
+            self._batch_totals[key] = self._batch_totals.get(key, 0) + payment['amount']
+        else:
+            key = len(self._payments)
+        self._payments.setdefault(key, []).append(payment)
+
+        self._nb_of_txs += 1
+        self._ctrl_sum += payment['amount']
+
+    def _add_to_batch_list(self, TX, payment):
+        self._tx_nodes.append(TX['DrctDbtTxInfNode'])
+
+    def _serialize_payment(self, payment):
+        root = self._xml.find(self.root_el)
+        SepaDD.add_payment(self, dict(payment))
+        if self._config['batch']:
+            node = self._tx_nodes.pop()
+        else:
+            node = root[-1]
+            root.remove(node)
+        return ET.tostring(node, "utf-8")
+
+    def _serialize_batch_header(self, key, count):
+        batches, self._batches = self._batches, OrderedDict([(key, [])])
+        try:
+            self._finalize_batch()
+        finally:
+            self._batches = batches
+
+        root = self._xml.find(self.root_el)
+        node = root[-1]
+        root.remove(node)
+        node.find('NbOfTxs').text = str(count)
+        return ET.tostring(node, "utf-8")[:-len(b"</PmtInf>")]
+
+    def iter_export(self):
+        """Yields the XML document in chunks of one transaction."""
+        GrpHdr_node = self._xml.find(self.root_el).find('GrpHdr')
+        GrpHdr_node.find('NbOfTxs').text = str(self._nb_of_txs)
+        GrpHdr_node.find('CtrlSum').text = int_to_decimal_str(self._ctrl_sum)
+
+        document_end = b"</" + self.root_el.encode() + b"></Document>"
+        yield b"<?xml version=\"1.0\" encoding=\"UTF-8\"?>" + \
+            ET.tostring(self._xml, "utf-8")[:-len(document_end)]
+
+        for key, payments in self._payments.items():
+            if self._config['batch']:
+                yield self._serialize_batch_header(key, len(payments))
+            for payment in payments:
+                yield self._serialize_payment(payment)
+            if self._config['batch']:
+                yield b"</PmtInf>"
+
+        yield document_end
+
+    def export(self, validate=True, pretty_print=False):
+        out = b"".join(self.iter_export())
+
+        if pretty_print:
+            from xml.dom import minidom
+            out = minidom.parseString(out).toprettyxml(encoding="utf-8")
+
+        if validate:
+            try_valid_xml(out, self.schema)
+        return out
+
+    def write(self, file):
+        """
+        Writes the document to the named binary ``file`` and validates it
+        there.
+        """
+        for chunk in self.iter_export():
+            file.write(chunk)
+        file.flush()
+        validate_sepa_file(file.name, self.schema)
+        file.seek(0)
+
+
+def validate_sepa_file(path, schema):
+    """
+    Validates the SEPA document at ``path`` like sepaxml's try_valid_xml,
+    without loading the whole document.
+    """
+    import xmlschema  # see sepaxml.validation on importing it globally
+
+    try:
+        xml_schema = xmlschema.XMLSchema(
+            os.path.join(os.path.dirname(sepaxml.__file__), 'schemas', schema + '.xsd'))
+        xml_schema.validate(xmlschema.XMLResource(path, lazy=True))
+    except xmlschema.XMLSchemaValidationError as e:
+        raise ValidationError(
+            "The output SEPA file contains validation errors. This is likely due to an illegal value in one of "
+            "your input fields."
+        ) from e
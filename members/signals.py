@@ -0,0 +1,114 @@
+from django.contrib.auth.models import User
+from django.db.models import Min
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .lists import invalidate_member_lists
+from .matching import invalidate_bank_import_rules
+from .models import BankImportMatcher, ContactInfo, MemberBalance, MembershipFee, \
+    MembershipPeriod, Payment, update_member_balances
+from .snapshots import invalidate_membership_snapshots
+
+
+def _affected_user_ids(instance):
+    previous = getattr(instance, '_previous', None) or {}
+    user_ids = {instance.user_id, previous.get('user_id')}
+    user_ids.discard(None)
+    return user_ids
+
+
+@receiver(pre_save, sender=Payment)
+@receiver(pre_save, sender=MembershipPeriod)
+@receiver(pre_save, sender=MembershipFee)
+def remember_previous_values(sender, instance, **kwargs):
+    # e.g. moving a payment or period to another member changes both
+    # balances
+    if instance.pk is not None:
+        instance._previous = sender.objects.filter(pk=instance.pk).values().first()
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_save, sender=MembershipPeriod)
+def update_balance(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    update_member_balances(_affected_user_ids(instance))
+
+
+@receiver(post_delete, sender=Payment)
+@receiver(post_delete, sender=MembershipPeriod)
+def invalidate_balance(sender, instance, **kwargs):
+    # deletes may be part of deleting the user, so don't create new rows
+    # here. The balance is recomputed on the next lookup.
+    MemberBalance.objects.filter(user_id__in=_affected_user_ids(instance)).delete()
+
+
+@receiver(post_save, sender=MembershipFee)
+def update_balances_for_fee(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    update_member_balances(set(
+        MembershipPeriod.objects.filter(kind_of_membership_id=instance.kind_of_membership_id)
+        .values_list('user_id', flat=True)
+    ))
+
+
+@receiver(post_delete, sender=MembershipFee)
+def invalidate_balances_for_fee(sender, instance, **kwargs):
+    MemberBalance.objects.filter(
+        user__membershipperiod__kind_of_membership_id=instance.kind_of_membership_id
+    ).delete()
+
+
+@receiver(post_save, sender=MembershipPeriod)
+@receiver(post_delete, sender=MembershipPeriod)
+def invalidate_snapshots_for_period(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # joins and resignations depend on all periods of the member and the
+    # number of members accumulates, so every month since the member's
+    # first period may change
+    begins = [instance.begin]
+    previous = getattr(instance, '_previous', None)
+    if previous:
+        begins.append(previous['begin'])
+    first_begin = MembershipPeriod.objects.filter(user_id__in=_affected_user_ids(instance)) \
+        .aggregate(Min('begin'))['begin__min']
+    if first_begin is not None:
+        begins.append(first_begin)
+    invalidate_membership_snapshots(min(begins))
+
+
+@receiver(post_save, sender=MembershipFee)
+@receiver(post_delete, sender=MembershipFee)
+def invalidate_snapshots_for_fee(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    fees = [instance]
+    previous = getattr(instance, '_previous', None)
+    if previous:
+        fees.append(MembershipFee(start=previous['start'], end=previous['end']))
+    ends = [f.end for f in fees]
+    invalidate_membership_snapshots(
+        min(f.start for f in fees),
+        None if None in ends else max(ends),
+    )
+
+
+@receiver(post_save, sender=BankImportMatcher)
+@receiver(post_delete, sender=BankImportMatcher)
+def invalidate_rules_for_matcher(sender, instance, **kwargs):
+    invalidate_bank_import_rules()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=ContactInfo)
+@receiver(post_save, sender=MembershipPeriod)
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=ContactInfo)
+@receiver(post_delete, sender=MembershipPeriod)
+def invalidate_lists(sender, instance, update_fields=None, **kwargs):
+    # logging in only updates last_login
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    invalidate_member_lists()
@@ -0,0 +1,201 @@
+"""
+Monthly membership snapshots.
+
+For every month a MembershipSnapshot records the member history figures
+(see get_list_of_history_entries) and, per kind of membership, the periods
+and members active on the first of the month and the fees expected from
+them. Closed months are stored once they are needed or by the
+update_membership_snapshots command and deleted again by members.signals
+when periods or fees of that month change. The current and future months
+are always computed on the fly.
+
+The figures are computed by loading all periods once and sweeping them in
+begin order over the months.
+"""
+from bisect import insort
+from collections import Counter, defaultdict
+from datetime import date
+from heapq import heappush, heappop
+
+from dateutil.rrule import rrule, MONTHLY
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from .ledger import find_membership_fee
+from .models import MembershipFee, MembershipPeriod, MembershipSnapshot, \
+    MembershipSnapshotKind
+from .util import get_list_of_history_entries
+
+
+def sweep_membership_periods(months, periods):
+    """
+    Yields (month, periods, members) for every month in the ascending
+    ``months``. A period (pk, user id, kind id, begin, end) is active in a
+    month if it begins on or before and ends on or after the month's date.
+    ``periods`` counts the active periods per kind of membership id,
+    ``members`` counts every member once, by the kind of their active
+    period with the lowest pk.
+    """
+    periods = sorted(periods, key=lambda p: p[3])
+    ending = []
+    period_kinds = Counter()
+    member_kinds = Counter()
+    active = defaultdict(list)
+    i = 0
+
+    def change(user_id, update):
+        user_periods = active[user_id]
+        before = user_periods[0] if user_periods else None
+        update(user_periods)
+        after = user_periods[0] if user_periods else None
+        if before != after:
+            if before is not None:
+                member_kinds[before[1]] -= 1
+            if after is not None:
+                member_kinds[after[1]] += 1
+
+    for month in months:
+        while i < len(periods) and periods[i][3] <= month:
+            pk, user_id, kind_id, begin, end = periods[i]
+            i += 1
+            period_kinds[kind_id] += 1
+            change(user_id, lambda p: insort(p, (pk, kind_id)))
+            if end is not None:
+                heappush(ending, (end, pk, user_id, kind_id))
+        while ending and ending[0][0] < month:
+            end, pk, user_id, kind_id = heappop(ending)
+            period_kinds[kind_id] -= 1
+            change(user_id, lambda p: p.remove((pk, kind_id)))
+        yield month, period_kinds, member_kinds
+
+
+def build_membership_snapshots(months):
+    """
+    Computes unsaved MembershipSnapshots for the ascending first-of-month
+    dates in ``months``. Returns a dict month -> snapshot, the kinds of
+    every snapshot are in its ``kind_rows`` attribute.
+    """
+    if not months:
+        return {}
+
+    history = get_list_of_history_entries()
+    fees = list(MembershipFee.objects.all())
+    periods = MembershipPeriod.objects.filter(
+        Q(begin__lte=months[-1]),
+        Q(end__isnull=True) | Q(end__gte=months[0]),
+    ).values_list('pk', 'user_id', 'kind_of_membership_id', 'begin', 'end')
+
+    snapshots = {}
+
+    for month, period_kinds, member_kinds in sweep_membership_periods(months, periods):
+        he = history.get(month)
+        snapshot = MembershipSnapshot(
+            month=month,
+            num_member=he.num_member if he else 0,
+            new_member=he.new_member if he else 0,
+            resigned_member=he.resigned_member if he else 0,
+        )
+        snapshot.kind_rows = []
+
+        for kind_id in sorted(set(period_kinds) | set(member_kinds)):
+            count = period_kinds[kind_id]
+            if count <= 0 and member_kinds[kind_id] <= 0:
+                continue
+            fee = find_membership_fee(fees, kind_id, month)
+            snapshot.kind_rows.append(MembershipSnapshotKind(
+                kind_of_membership_id=kind_id,
+                periods=count,
+                members=member_kinds[kind_id],
+                fees=None if fee is None else count * fee.amount,
+            ))
+
+        snapshots[month] = snapshot
+
+    return snapshots
+
+
+def get_first_of_month(day=None):
+    day = day or date.today()
+    return date(day.year, day.month, 1)
+
+
+def save_membership_snapshots(snapshots):
+    try:
+        with transaction.atomic():
+            MembershipSnapshot.objects.bulk_create(snapshots)
+            # bulk_create doesn't set primary keys on every database
+            pks = dict(MembershipSnapshot.objects.filter(
+                month__in=[s.month for s in snapshots]).values_list('month', 'pk'))
+            rows = []
+            for snapshot in snapshots:
+                snapshot.pk = pks[snapshot.month]
+                for row in snapshot.kind_rows:
+                    row.snapshot_id = snapshot.pk
+                    rows.append(row)
+            MembershipSnapshotKind.objects.bulk_create(rows)
+    except IntegrityError:
+        # stored by a concurrent request in the meantime
+        pass
+
+
+def get_membership_snapshots(months, today=None):
+    """
+    Returns a dict month -> MembershipSnapshot for the ascending
+    first-of-month dates in ``months``, storing the closed months which
+    have not been stored yet.
+    """
+    current_month = get_first_of_month(today)
+
+    snapshots = {}
+    for snapshot in MembershipSnapshot.objects.filter(
+            month__in=[m for m in months if m < current_month]) \
+            .prefetch_related('kinds'):
+        snapshot.kind_rows = list(snapshot.kinds.all())
+        snapshots[snapshot.month] = snapshot
+
+    built = build_membership_snapshots([m for m in months if m not in snapshots])
+    closed = [s for month, s in built.items() if month < current_month]
+    if closed:
+        save_membership_snapshots(closed)
+    snapshots.update(built)
+
+    return snapshots
+
+
+HISTORY_CACHE_KEY = 'members.history'
+
+
+def get_member_history(today=None):
+    """
+    Returns the member history of every month since March 2006 as list of
+    dicts, cached until a period changes or the day rolls over.
+    """
+    today = today or date.today()
+    cached = cache.get(HISTORY_CACHE_KEY)
+    if cached is not None and cached[0] == today:
+        return cached[1]
+
+    months = [dt.date() for dt in rrule(MONTHLY, dtstart=date(2006, 3, 1), until=today)]
+    snapshots = get_membership_snapshots(months, today)
+    history = [
+        {
+            'month': month,
+            'num_member': snapshots[month].num_member,
+            'new_member': snapshots[month].new_member,
+            'resigned_member': snapshots[month].resigned_member,
+        }
+        for month in months
+    ]
+
+    cache.set(HISTORY_CACHE_KEY, (today, history), None)
+    return history
+
+
+def invalidate_membership_snapshots(first_day, last_day=None):
+    """Deletes the stored snapshots of the months from first_day to last_day."""
+    cache.delete(HISTORY_CACHE_KEY)
+    snapshots = MembershipSnapshot.objects.filter(month__gte=get_first_of_month(first_day))
+    if last_day is not None:
+        snapshots = snapshots.filter(month__lte=last_day)
+    snapshots.delete()
@@ -0,0 +1,76 @@
+"""
+Monthly membership statistics as shown by the hetti.
+
+The membership figures come from the monthly snapshots (see
+members.snapshots), the payments are summed per month by the database. The
+number of queries does not depend on the number of months.
+"""
+from collections import defaultdict
+
+from dateutil.relativedelta import relativedelta
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+
+from .ledger import MissingMembershipFee
+from .models import KindOfMembership, Payment, get_month_list
+from .snapshots import get_membership_snapshots
+
+
+def get_monthly_payments(first_month, last_month):
+    payments = Payment.objects.filter(
+        date__gte=first_month,
+        date__lt=last_month + relativedelta(months=1),
+    ).annotate(month=TruncMonth('date')).order_by().values('month') \
+        .annotate(total=Sum('amount')).values_list('month', 'total')
+    return dict(payments)
+
+
+def get_monthly_statistics(start_date, end_date):
+    """
+    Returns the statistics for every month from the month of start_date up
+    to (but not including) end_date.
+    """
+    months = list(get_month_list(start_date.replace(day=1), end_date))
+    if not months:
+        return []
+
+    kinds = list(KindOfMembership.objects.order_by('pk'))
+    snapshots = get_membership_snapshots(months)
+    payments = get_monthly_payments(months[0], months[-1])
+
+    result = []
+
+    for month in months:
+        month_statistics = {
+            "month": month,
+            "spind_kinds": defaultdict(int),
+            "fee_category_kinds": defaultdict(int),
+            "total_fees": 0,
+            "total_fees_spind": 0,
+            "total_fees_membership": 0,
+        }
+        rows = {row.kind_of_membership_id: row for row in snapshots[month].kind_rows}
+
+        for kind in kinds:
+            row = rows.get(kind.pk)
+            if row is None or row.periods <= 0:
+                continue
+
+            month_statistics["spind_kinds"][kind.get_spind_display()] += row.periods
+            month_statistics["fee_category_kinds"][kind.get_fee_category_display()] += row.periods
+
+            if row.fees is None:
+                raise MissingMembershipFee(f"could not find a membership fee for month {month} and kind of membership {kind}")
+
+            fees_spind = row.periods * kind.spind_fee
+
+            month_statistics["total_fees"] += row.fees
+            month_statistics["total_fees_spind"] += fees_spind
+            month_statistics["total_fees_membership"] += row.fees - fees_spind
+
+        month_statistics["total_payments"] = payments.get(month) or 0
+        month_statistics["spind_kinds"] = dict(month_statistics["spind_kinds"])
+        month_statistics["fee_category_kinds"] = dict(month_statistics["fee_category_kinds"])
+        result.append(month_statistics)
+
+    return result
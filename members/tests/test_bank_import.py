@@ -0,0 +1,189 @@
+import io
+import json
+import random
+
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from members.matching import Automaton, get_bank_import_rules
+from members.models import BankCollectionMode, BankImportMatcher, Payment, \
+    PaymentInfo, PaymentMethod
+
+
+def erste_transaction(number, partner_name, iban, reference='', value=2000):
+    return {
+        "referenceNumber": f"REF{number}",
+        "booking": "2023-07-03T00:00:00.000+0200",
+        "partnerName": partner_name,
+        "partnerAccount": {"iban": iban},
+        "amount": {"value": value, "precision": 2, "currency": "EUR"},
+        "reference": reference,
+        "receiverReference": "",
+    }
+
+
+class AutomatonTest(TestCase):
+    def test_finds_the_same_patterns_as_in(self):
+        rng = random.Random(42)
+        patterns = ['', 'a', 'ab', 'abc', 'bca', 'c', 'cab', 'bb', 'abab', 'xyz']
+        automaton = Automaton(patterns)
+        for _ in range(200):
+            text = ''.join(rng.choice('abcx') for _ in range(rng.randrange(12)))
+            self.assertEqual(automaton.find(text),
+                             {i for i, p in enumerate(patterns) if p in text}, text)
+
+
+class BankImportTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create(username='admin', is_superuser=True)
+        self.member = User.objects.create(username='member')
+        self.client.force_login(self.admin)
+
+    def upload(self, transactions):
+        upload = io.BytesIO(json.dumps(transactions).encode())
+        upload.name = 'erste.json'
+        return self.client.post('/member/bank/json/import', {'statement': upload})
+
+    def test_csv_statement(self):
+        upload = io.BytesIO(b"Datum;Name;IBAN;Betrag;Text\n03.07.2023;Member;AT99;20,00;Beitrag\n")
+        upload.name = 'statement.csv'
+        response = self.client.post('/member/bank/json/import', {'statement': upload, 'format': 'csv'})
+        row, = response.context['import_rows']
+        self.assertEqual((row['payment']['partnerName'], row['payment']['amount']['value_full']),
+                         ('Member', 20.0))
+
+    def test_old_field_name(self):
+        upload = io.BytesIO(json.dumps([erste_transaction(1, 'Member', 'AT99')]).encode())
+        upload.name = 'erste.json'
+        response = self.client.post('/member/bank/json/import', {'erstejson': upload})
+        self.assertEqual(len(response.context['import_rows']), 1)
+
+    def test_invalid_statement(self):
+        upload = io.BytesIO(b"[{")
+        upload.name = 'erste.json'
+        response = self.client.post('/member/bank/json/import', {'statement': upload})
+        self.assertRedirects(response, '/member/bank/', fetch_redirect_response=False)
+
+    def test_matchers_keep_their_precedence(self):
+        BankImportMatcher.objects.create(matcher='Energie', action='color', color='red')
+        BankImportMatcher.objects.create(matcher='AT99', action='match_to', member=self.member)
+        BankImportMatcher.objects.create(matcher='Strom', action='color', color='blue')
+        BankImportMatcher.objects.create(matcher='Abbuchung', action='drop')
+
+        response = self.upload([
+            erste_transaction(1, 'Wien Energie', 'AT991234', 'Strom'),
+            erste_transaction(2, 'Wien Energie', 'AT11', 'Abbuchung Strom'),
+            erste_transaction(3, 'Someone', 'AT11', 'Mitgliedsbeitrag'),
+        ])
+
+        rows = response.context['import_rows']
+        self.assertEqual([row['payment']['referenceNumber'] for row in rows], ['REF1', 'REF3'])
+        self.assertEqual(rows[0]['color'], 'blue')
+        self.assertEqual(list(rows[0]['matched_members']), [self.member])
+        self.assertEqual(rows[1]['color'], '')
+
+    def test_rules_are_cached_until_a_matcher_changes(self):
+        matcher = BankImportMatcher.objects.create(matcher='Energie', action='drop')
+        get_bank_import_rules()
+        with self.assertNumQueries(0):
+            get_bank_import_rules()
+
+        matcher.matcher = 'Strom'
+        matcher.save()
+        self.assertEqual(len(get_bank_import_rules().match(['Strom'])), 1)
+
+        matcher.delete()
+        self.assertEqual(get_bank_import_rules().match(['Strom']), [])
+
+    def test_members_are_matched_by_iban(self):
+        mode = BankCollectionMode.objects.create(name='monthly', num_month=1)
+        PaymentInfo.objects.create(user=self.member, bank_collection_mode=mode,
+                                   bank_account_iban='at61 1904 3002 3457 3201')
+        Payment.objects.create(user=self.member, amount=20, date='2023-06-01',
+                               method=PaymentMethod.objects.create(name='bank transfer'),
+                               original_line='REF2')
+
+        rows = self.upload([
+            erste_transaction(1, 'Member', 'AT611904300234573201'),
+            erste_transaction(2, 'Member', 'AT611904300234573201'),
+            erste_transaction(3, 'Member', 'AT611904300234573201', value=-2000),
+        ]).context['import_rows']
+
+        self.assertEqual([list(row['matched_members']) for row in rows], [[self.member], [], []])
+        self.assertEqual(rows[1]['color'], 'rgba(0, 0, 0, 0.2)')
+
+    def test_constant_number_of_queries(self):
+        def count_queries(count):
+            with CaptureQueriesContext(connection) as ctx:
+                self.upload([erste_transaction(i, f'Member {i}', f'AT{i}') for i in range(count)])
+            return len(ctx.captured_queries)
+
+        count_queries(1)  # cache the rules
+        self.assertEqual(count_queries(2), count_queries(20))
+
+
+class BankMatchTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create(username='admin', is_superuser=True)
+        self.members = [User.objects.create(username=f'member{i}') for i in range(3)]
+        PaymentMethod.objects.create(name='bank collection')
+        PaymentMethod.objects.create(name='bank transfer')
+        self.client.force_login(self.admin)
+
+    def submit(self, lines):
+        data = {'upload_filename': 'erste.json'}
+        for field in ['text', 'referenceNumber', 'member_pk', 'value', 'date']:
+            data[field + '[]'] = [line[field] for line in lines]
+        return self.client.post('/member/bank/json/match', data)
+
+    def lines(self, count):
+        return [{
+            'text': f'Mitgliedsbeitrag {i}',
+            'referenceNumber': f'REF{i}',
+            'member_pk': self.members[i % 3].pk if i % 4 else '',
+            'value': '-20.0' if i == 5 else '20.0',
+            'date': '2023-07-03',
+        } for i in range(count)]
+
+    def test_creates_payments_once(self):
+        self.submit(self.lines(8))
+        self.submit(self.lines(10))
+
+        payments = Payment.objects.order_by('original_line')
+        self.assertEqual([p.original_line for p in payments],
+                         ['REF1', 'REF2', 'REF3', 'REF5', 'REF6', 'REF7', 'REF9'])
+        self.assertEqual(payments.get(original_line='REF5').method.name, 'bank collection')
+        self.assertEqual(payments.get(original_line='REF9').user, self.members[0])
+        self.assertEqual(self.members[1].memberbalance.payments, 40.0)
+
+    def test_constant_number_of_queries(self):
+        def count_queries(lines):
+            with CaptureQueriesContext(connection) as ctx:
+                self.submit(lines)
+            return len(ctx.captured_queries)
+
+        lines = self.lines(100)
+        self.assertEqual(count_queries(lines[:10]), count_queries(lines[10:]))
+
+    def test_failure_imports_nothing(self):
+        lines = self.lines(4)
+        lines[3]['value'] = 'not a number'
+        response = self.submit(lines)
+        self.assertRedirects(response, '/member/bank/', fetch_redirect_response=False)
+        self.assertIn('Invalid line REF3', [str(m) for m in get_messages(response.wsgi_request)][0])
+        self.assertFalse(Payment.objects.exists())
+
+    def test_incomplete_data_imports_nothing(self):
+        data = {'upload_filename': 'erste.json'}
+        for field in ['text', 'referenceNumber', 'member_pk', 'value', 'date']:
+            data[field + '[]'] = [line[field] for line in self.lines(4)]
+        data['value[]'].pop()
+        response = self.client.post('/member/bank/json/match', data)
+        self.assertEqual([str(m) for m in get_messages(response.wsgi_request)],
+                         ['Incomplete data, nothing imported.'])
+        self.assertFalse(Payment.objects.exists())
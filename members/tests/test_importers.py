@@ -0,0 +1,161 @@
+import io
+import json
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+
+from members.importers import BankImportError, iter_camt053, iter_csv, \
+    iter_json_array, make_reference_number, read_bank_statement
+
+
+class JsonArrayTest(SimpleTestCase):
+    def parse(self, text, chunk_size):
+        return list(iter_json_array(io.BytesIO(text.encode()), chunk_size=chunk_size))
+
+    def test_matches_json_load(self):
+        for text in [
+            '[]',
+            ' [ ] ',
+            '[1, 22, 333]',
+            '[{"name": "Jörg", "amount": {"value": 1234, "precision": 2}}, null, "a]b", [1, [2]]]\n',
+            '﻿[{"a": "\\u00e4\\"}"}, 1.5e3 ,true]',
+        ]:
+            for chunk_size in [1, 2, 3, 7, 64 * 1024]:
+                self.assertEqual(self.parse(text, chunk_size), json.loads(text.lstrip('﻿')),
+                                 (text, chunk_size))
+
+    def test_invalid_json(self):
+        for text in ['', '{}', '[1, 2', '[1 2]', '[1,]', '[1] 2', '[{"a": }]']:
+            for chunk_size in [1, 64 * 1024]:
+                with self.assertRaises(json.JSONDecodeError, msg=(text, chunk_size)):
+                    self.parse(text, chunk_size)
+
+    def test_element_size_is_limited(self):
+        upload = io.BytesIO(('["' + 'a' * 1000).encode())
+        with self.assertRaises(json.JSONDecodeError):
+            list(iter_json_array(upload, chunk_size=100, max_element_size=500))
+        self.assertLess(upload.tell(), 700)
+        self.assertEqual(self.parse('["' + 'a' * 1000 + '"]', 100), ['a' * 1000])
+
+    def test_elements_are_read_incrementally(self):
+        upload = io.BytesIO(('[' + ','.join(['{"a": 1}'] * 1000) + ']').encode())
+        elements = iter_json_array(upload, chunk_size=100)
+        next(elements)
+        self.assertLess(upload.tell(), 200)
+
+
+CAMT053 = """<?xml version="1.0" encoding="UTF-8"?>
+<Document xmlns="urn:iso:std:iso:20022:tech:xsd:camt.053.001.02">
+  <BkToCstmrStmt>
+    <Stmt>
+      <Id>STMT1</Id>
+      <Ntry>
+        <Amt Ccy="EUR">20.00</Amt>
+        <CdtDbtInd>CRDT</CdtDbtInd>
+        <BookgDt><Dt>2023-07-03</Dt></BookgDt>
+        <AcctSvcrRef>REF1</AcctSvcrRef>
+        <NtryDtls><TxDtls>
+          <RltdPties>
+            <Dbtr><Nm>Jörg Müller</Nm></Dbtr>
+            <DbtrAcct><Id><IBAN>AT611904300234573201</IBAN></Id></DbtrAcct>
+            <Cdtr><Nm>Verein Metalab</Nm></Cdtr>
+          </RltdPties>
+          <RmtInf><Ustrd>Mitgliedsbeitrag</Ustrd><Ustrd>Juli</Ustrd></RmtInf>
+        </TxDtls></NtryDtls>
+      </Ntry>
+      <Ntry>
+        <Amt Ccy="EUR">55.50</Amt>
+        <CdtDbtInd>DBIT</CdtDbtInd>
+        <BookgDt><Dt>2023-07-04</Dt></BookgDt>
+        <NtryDtls>
+          <TxDtls>
+            <Refs><AcctSvcrRef>REF2</AcctSvcrRef></Refs>
+            <Amt Ccy="EUR">50.50</Amt>
+            <RltdPties><Cdtr><Nm>Wien Energie</Nm></Cdtr></RltdPties>
+          </TxDtls>
+          <TxDtls>
+            <AmtDtls><TxAmt><Amt Ccy="EUR">5.00</Amt></TxAmt></AmtDtls>
+            <RltdPties><Cdtr><Nm>Bank</Nm></Cdtr></RltdPties>
+            <RmtInf><Ustrd>Spesen</Ustrd></RmtInf>
+          </TxDtls>
+        </NtryDtls>
+      </Ntry>
+    </Stmt>
+  </BkToCstmrStmt>
+</Document>
+"""
+
+
+class Camt053Test(SimpleTestCase):
+    def test_transactions(self):
+        transactions = list(iter_camt053(io.BytesIO(CAMT053.encode())))
+
+        self.assertEqual(transactions[0], {
+            "referenceNumber": "REF1",
+            "booking": "2023-07-03",
+            "partnerName": "Jörg Müller",
+            "partnerAccount": {"iban": "AT611904300234573201"},
+            "amount": {"value": 2000, "precision": 2, "currency": "EUR"},
+            "reference": "Mitgliedsbeitrag Juli",
+            "receiverReference": "",
+        })
+        self.assertEqual([(t["referenceNumber"], t["partnerName"], t["amount"]["value"])
+                          for t in transactions[1:2]], [("REF2", "Wien Energie", -5050)])
+        self.assertEqual(transactions[2]["amount"]["value"], -500)
+        self.assertEqual(len(transactions[2]["referenceNumber"]), 40)
+
+    def test_invalid_amount(self):
+        for amount in ['20,00', 'NaN']:
+            text = CAMT053.replace('<Amt Ccy="EUR">20.00</Amt>', f'<Amt Ccy="EUR">{amount}</Amt>')
+            with self.assertRaises(BankImportError):
+                list(read_bank_statement(io.BytesIO(text.encode()), "camt053"))
+
+    def test_invalid_xml(self):
+        with self.assertRaises(BankImportError):
+            list(read_bank_statement(io.BytesIO(b"<Document><Ntry>"), "camt053"))
+
+
+class CsvTest(SimpleTestCase):
+    def test_german_export(self):
+        text = (
+            "Buchungsdatum;Partnername;Partner IBAN;Betrag;Währung;Verwendungszweck\r\n"
+            "03.07.2023;Jörg Müller;AT61 1904 3002 3457 3201;1.020,00;EUR;Mitgliedsbeitrag\r\n"
+            "\r\n"
+            '04.07.2023;"Wien Energie; GmbH";;-55,50;EUR;"Strom\r\nJuli"\r\n'
+        )
+        transactions = list(iter_csv(io.BytesIO(text.encode('cp1252'))))
+
+        self.assertEqual([(t["booking"], t["partnerName"], t["amount"]["value"], t["reference"])
+                          for t in transactions], [
+            ("2023-07-03", "Jörg Müller", 102000, "Mitgliedsbeitrag"),
+            ("2023-07-04", "Wien Energie; GmbH", -5550, "Strom\r\nJuli"),
+        ])
+        self.assertEqual(transactions[0]["partnerAccount"]["iban"], "AT61 1904 3002 3457 3201")
+        self.assertEqual(transactions[0]["referenceNumber"],
+                         next(iter_csv(io.BytesIO(text.encode('cp1252'))))["referenceNumber"])
+
+    def test_comma_separated(self):
+        text = "Date,Amount,Name,IBAN,Reference,Reference number\n2023-07-03,20.00,Someone,AT11,fee (u5),X1\n"
+        transaction, = iter_csv(io.BytesIO(text.encode()))
+        self.assertEqual((transaction["referenceNumber"], transaction["amount"]["value"],
+                          transaction["amount"]["currency"]), ("X1", 2000, "EUR"))
+
+    def test_identical_rows(self):
+        text = "Datum;Name;Betrag;Text\n" + "2023-07-03;Someone;20,00;fee\n" * 2
+        references = [t["referenceNumber"] for t in iter_csv(io.BytesIO(text.encode()))]
+        self.assertNotEqual(references[0], references[1])
+        self.assertEqual(references, [t["referenceNumber"] for t in iter_csv(io.BytesIO(text.encode()))])
+        # a single row keeps the reference it had before
+        self.assertEqual(references[0],
+                         make_reference_number("2023-07-03", Decimal("20.00"), "Someone", "", "fee"))
+
+    def test_utf8_character_across_the_sample(self):
+        text = ("Datum;Name;Betrag\n" + "2023-07-03;Someone;20,00\n" * 5 +
+                "2023-07-03;Jörg Müller;20,00\n").encode()
+        sample_size = text.index("ö".encode()) + 1
+        transactions = list(iter_csv(io.BytesIO(text), sample_size=sample_size))
+        self.assertEqual(transactions[-1]["partnerName"], "Jörg Müller")
+
+    def test_missing_columns(self):
+        with self.assertRaises(BankImportError):
+            list(iter_csv(io.BytesIO(b"Name;Text\nfoo;bar\n")))
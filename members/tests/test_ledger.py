@@ -0,0 +1,101 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from freezegun import freeze_time
+
+from members.ledger import MissingMembershipFee, get_period_segments, \
+    get_next_charge_date
+from members.models import ContactInfo, KindOfMembership, MembershipFee, \
+    MembershipPeriod
+
+
+def walk_membership_fees(periods, fees):
+    """The month by month computation the ledger replaces."""
+    for mp in periods:
+        for month in mp.get_months():
+            fee = mp.get_membership_fee(month, fees)
+            if fee.amount > 0:
+                yield (month, fee.amount)
+
+
+@freeze_time('2023-07-20')
+class LedgerTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='ledger')
+        self.info = ContactInfo.objects.create(user=self.user)
+        self.kind = KindOfMembership.objects.create(name='Mitglied')
+        self.other_kind = KindOfMembership.objects.create(name='ermäßigt')
+        MembershipFee.objects.create(kind_of_membership=self.kind, amount=20,
+                                     start=datetime.date(2000, 1, 1),
+                                     end=datetime.date(2012, 3, 15))
+        MembershipFee.objects.create(kind_of_membership=self.other_kind, amount=10,
+                                     start=datetime.date(2000, 1, 1))
+        MembershipFee.objects.create(kind_of_membership=self.kind, amount=25,
+                                     start=datetime.date(2012, 3, 16),
+                                     end=datetime.date(2019, 12, 31))
+        MembershipFee.objects.create(kind_of_membership=self.kind, amount=0,
+                                     start=datetime.date(2020, 1, 1),
+                                     end=datetime.date(2020, 6, 30))
+        MembershipFee.objects.create(kind_of_membership=self.kind, amount=30,
+                                     start=datetime.date(2019, 1, 1))
+
+    def add_period(self, begin, end=None, kind=None):
+        return MembershipPeriod.objects.create(
+            user=self.user, begin=begin, end=end,
+            kind_of_membership=kind or self.kind)
+
+    def assertMatchesMonthWalk(self):
+        fees = list(MembershipFee.objects.all())
+        periods = MembershipPeriod.objects.filter(user=self.user)
+        expected = list(walk_membership_fees(periods, fees))
+
+        self.assertEqual(list(self.info.get_membership_fees()), expected)
+        self.assertEqual(self.info.get_debts(), sum(f[1] for f in expected))
+
+    def test_open_period(self):
+        self.add_period(datetime.date(2008, 5, 1))
+        self.assertMatchesMonthWalk()
+
+    def test_closed_periods(self):
+        self.add_period(datetime.date(2006, 3, 1), datetime.date(2011, 12, 31))
+        self.add_period(datetime.date(2012, 2, 14), datetime.date(2012, 4, 15))
+        self.add_period(datetime.date(2015, 1, 1), datetime.date(2021, 1, 1),
+                        kind=self.other_kind)
+        self.assertMatchesMonthWalk()
+
+    def test_clamped_begin_day(self):
+        self.add_period(datetime.date(2011, 8, 31), datetime.date(2013, 1, 30))
+        self.add_period(datetime.date(2015, 1, 30))
+        self.assertMatchesMonthWalk()
+
+    def test_period_ending_on_charge_date(self):
+        self.add_period(datetime.date(2012, 1, 16), datetime.date(2012, 3, 16))
+        self.add_period(datetime.date(2019, 11, 1), datetime.date(2020, 7, 1))
+        self.assertMatchesMonthWalk()
+
+    def test_future_period(self):
+        self.add_period(datetime.date(2024, 1, 1))
+        self.assertMatchesMonthWalk()
+        self.assertEqual(self.info.get_debts(), 0)
+
+    def test_missing_fee(self):
+        period = self.add_period(datetime.date(1999, 11, 1), datetime.date(2000, 2, 1))
+        fees = list(MembershipFee.objects.all())
+        with self.assertRaises(MissingMembershipFee):
+            get_period_segments(period, fees)
+
+    def test_segments(self):
+        period = self.add_period(datetime.date(2011, 1, 1), datetime.date(2013, 1, 1))
+        fees = list(MembershipFee.objects.all())
+        segments = get_period_segments(period, fees)
+        self.assertEqual([(s.fee.amount, s.count) for s in segments],
+                         [(20, 15), (25, 9)])
+
+    def test_next_charge_date(self):
+        period = self.add_period(datetime.date(2008, 5, 15))
+        self.assertEqual(get_next_charge_date(period), datetime.date(2023, 8, 15))
+        period = self.add_period(datetime.date(2008, 5, 25))
+        self.assertEqual(get_next_charge_date(period), datetime.date(2023, 7, 25))
+        period = self.add_period(datetime.date(2008, 5, 25), datetime.date(2023, 7, 25))
+        self.assertIsNone(get_next_charge_date(period))
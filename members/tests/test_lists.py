@@ -0,0 +1,163 @@
+import datetime
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from freezegun import freeze_time
+
+from core.cache import DATA_VERSION_KEY
+from members import lists
+from members.models import ContactInfo, KindOfMembership, MembershipPeriod
+
+
+@freeze_time('2023-07-20')
+class MemberListsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.kind = KindOfMembership.objects.create(name='Mitglied')
+        for i, (end, key, lazzzor, intern) in enumerate([
+            (None, '01-000000000001', True, 'one@example.com'),
+            (datetime.date(2023, 7, 20), '01-000000000002', False, ''),
+            (datetime.date(2023, 1, 1), '01-000000000003', True, 'three@example.com'),
+            (None, None, True, 'four@example.com'),
+        ]):
+            user = User.objects.create(username=f'member{i}')
+            ContactInfo.objects.create(user=user, key_id=key, has_active_key=True,
+                                       has_lazzzor_privileges=lazzzor, intern_list_email=intern)
+            MembershipPeriod.objects.create(user=user, kind_of_membership=self.kind,
+                                            begin=datetime.date(2020, 1, 1), end=end)
+            # a second period must not list the member twice
+            MembershipPeriod.objects.create(user=user, kind_of_membership=self.kind,
+                                            begin=datetime.date(2010, 1, 1), end=end)
+
+    def get(self, url, **headers):
+        return self.client.get(url, **headers)
+
+    def test_lists(self):
+        self.assertEqual(self.get('/member/keylist/').content,
+                         b'01-000000000001\r\n01-000000000002')
+        self.assertEqual(self.get('/member/lazzzorlist/').content,
+                         b'01-000000000001,member0,1.00')
+        self.assertEqual(self.get('/member/internlist/').content,
+                         b'one@example.com\r\nfour@example.com')
+
+    def test_cached_with_etag(self):
+        response = self.get('/member/keylist/')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get('/member/keylist/').content, response.content)
+            self.assertEqual(self.get('/member/keylist/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_rebuilt_when_a_member_changes(self):
+        self.get('/member/keylist/')
+        info = ContactInfo.objects.get(key_id='01-000000000002')
+        info.has_active_key = False
+        info.save()
+        self.assertEqual(self.get('/member/keylist/').content, b'01-000000000001')
+
+        MembershipPeriod.objects.filter(user__username='member0').update(end=datetime.date(2023, 1, 1))
+        MembershipPeriod.objects.filter(user__username='member0').first().save()
+        self.assertEqual(self.get('/member/keylist/').content, b'')
+
+    def test_rebuilt_after_the_commit(self):
+        self.get('/member/keylist/')
+        with self.captureOnCommitCallbacks(execute=True):
+            info = ContactInfo.objects.get(key_id='01-000000000002')
+            info.has_active_key = False
+            info.save()
+            # a poll before the commit still sees the key
+            cache.set(lists.get_member_list_key('keylist'), (b'stale', '"stale"'))
+            self.assertEqual(self.get('/member/keylist/').content, b'stale')
+        self.assertEqual(self.get('/member/keylist/').content, b'01-000000000001')
+
+    def test_logins_keep_the_cache(self):
+        self.get('/member/keylist/')
+        self.client.force_login(User.objects.get(username='member0'))
+        self.client.logout()
+        with self.assertNumQueries(0):
+            self.get('/member/keylist/')
+
+    def test_rebuilt_at_midnight(self):
+        self.get('/member/keylist/')
+        with freeze_time('2023-07-21'):
+            self.assertEqual(self.get('/member/keylist/').content, b'01-000000000001')
+
+
+@freeze_time('2023-07-20')
+class KeyListDeltaTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        kind = KindOfMembership.objects.create(name='Mitglied')
+        for i, end in enumerate([None, datetime.date(2023, 7, 20), None]):
+            user = User.objects.create(username=f'member{i}')
+            ContactInfo.objects.create(user=user, key_id=f'01-00000000000{i}', has_active_key=True)
+            MembershipPeriod.objects.create(user=user, kind_of_membership=kind,
+                                            begin=datetime.date(2020, 1, 1), end=end)
+
+    def get_delta(self, since=None):
+        return self.client.get('/member/keylist/delta/', {} if since is None else {'since': since}).json()
+
+    def test_snapshot_without_version(self):
+        delta = self.get_delta()
+        self.assertTrue(delta['snapshot'])
+        self.assertEqual(delta['keys'], ['01-000000000000', '01-000000000001', '01-000000000002'])
+        # a version the server doesn't know
+        self.assertEqual(self.get_delta(delta['version'] + 1), delta)
+
+    def test_up_to_date(self):
+        version = self.get_delta()['version']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_delta(version),
+                             {'version': version, 'snapshot': False, 'add': [], 'remove': []})
+
+    def test_up_to_date_while_the_lists_change(self):
+        version = self.get_delta()['version']
+        get_cached_version = lists.get_cached_key_list_version
+
+        def get_cached_key_list_version():
+            # a member is saved in another thread right after the cached
+            # version was read
+            cached = get_cached_version()
+            cache.incr(DATA_VERSION_KEY % 'member_lists')
+            return cached
+
+        with mock.patch('members.views.get_cached_key_list_version', get_cached_key_list_version):
+            self.assertEqual(self.get_delta(version),
+                             {'version': version, 'snapshot': False, 'add': [], 'remove': []})
+
+    def test_changes_since_version(self):
+        version = self.get_delta()['version']
+        info = ContactInfo.objects.get(key_id='01-000000000000')
+        info.has_active_key = False
+        info.save()
+        info = ContactInfo.objects.get(key_id='01-000000000002')
+        info.key_id = '01-000000000003'
+        info.save()
+
+        delta = self.get_delta(version)
+        self.assertEqual(delta['add'], ['01-000000000003'])
+        self.assertEqual(delta['remove'], ['01-000000000000', '01-000000000002'])
+        self.assertFalse(delta['snapshot'])
+
+        # revoking and granting a key again nets out to the grant
+        info.has_active_key = False
+        info.save()
+        self.get_delta()
+        info.has_active_key = True
+        info.save()
+        self.assertEqual(self.get_delta(delta['version'])['add'], ['01-000000000003'])
+
+    def test_period_ends_at_midnight(self):
+        version = self.get_delta()['version']
+        with freeze_time('2023-07-21'):
+            delta = self.get_delta(version)
+        self.assertEqual(delta['add'], [])
+        self.assertEqual(delta['remove'], ['01-000000000001'])
+
+    def test_snapshot_when_too_far_behind(self):
+        version = self.get_delta()['version']
+        ContactInfo.objects.update(has_active_key=False)
+        ContactInfo.objects.first().save()
+        with mock.patch('members.lists.KEY_LIST_DELTA_LIMIT', 2):
+            delta = self.get_delta(version)
+        self.assertEqual(delta, {'version': version + 3, 'snapshot': True, 'keys': []})
@@ -0,0 +1,74 @@
+import datetime
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from freezegun import freeze_time
+
+from members.models import ContactInfo, KindOfMembership, MemberBalance, \
+    MembershipFee, MembershipPeriod, Payment, PaymentMethod
+
+
+@freeze_time('2023-07-20')
+class MemberBalanceTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='balance')
+        self.info = ContactInfo.objects.create(user=self.user)
+        self.kind = KindOfMembership.objects.create(name='Mitglied')
+        self.fee = MembershipFee.objects.create(kind_of_membership=self.kind, amount=20,
+                                                start=datetime.date(2000, 1, 1))
+        self.method = PaymentMethod.objects.create(name='bank transfer')
+        self.period = MembershipPeriod.objects.create(
+            user=self.user, begin=datetime.date(2023, 1, 10),
+            kind_of_membership=self.kind)
+
+    def pay(self, amount):
+        return Payment.objects.create(user=self.user, amount=amount,
+                                      date=datetime.date(2023, 2, 1),
+                                      method=self.method)
+
+    def test_balance_is_created_by_signals(self):
+        balance = MemberBalance.objects.get(user=self.user)
+        self.assertEqual(balance.fees, 7 * 20)
+        self.assertEqual(balance.debts, self.info.get_debts())
+        self.assertEqual(balance.valid_until, datetime.date(2023, 8, 11))
+
+    def test_payment_updates_balance(self):
+        self.pay(50)
+        self.assertEqual(self.info.get_cached_debts(), 90)
+        self.assertEqual(self.info.get_cached_debts(), self.info.get_debts())
+
+    def test_fee_change_updates_balance(self):
+        self.fee.amount = 25
+        self.fee.save()
+        self.assertEqual(self.info.get_cached_debts(), 7 * 25)
+
+    def test_deleting_period_invalidates_balance(self):
+        payment = self.pay(50)
+        self.period.delete()
+        self.assertFalse(MemberBalance.objects.filter(user=self.user).exists())
+        self.assertEqual(self.info.get_cached_debts(), -50)
+        payment.delete()
+        self.assertEqual(self.info.get_cached_debts(), 0)
+
+    def test_deleting_user(self):
+        self.pay(50)
+        self.user.delete()
+        self.assertFalse(MemberBalance.objects.exists())
+
+    def test_lookup_is_one_query(self):
+        self.info.get_cached_debts()
+        with self.assertNumQueries(1):
+            self.info.get_cached_debts()
+
+    def test_month_rollover(self):
+        with freeze_time('2023-08-11'):
+            self.assertEqual(self.info.get_cached_debts(), 8 * 20)
+
+    def test_command(self):
+        MemberBalance.objects.all().delete()
+        out = StringIO()
+        call_command('update_member_balances', rebuild=True, verify=True, stdout=out)
+        self.assertIn('all balances match', out.getvalue())
+        self.assertEqual(MemberBalance.objects.get(user=self.user).debts, 140)
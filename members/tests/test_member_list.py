@@ -0,0 +1,55 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from freezegun import freeze_time
+
+from members.models import ContactInfo, KindOfMembership, MembershipFee, \
+    MembershipPeriod, annotate_member_debts, get_active_members
+
+
+@freeze_time('2023-07-20')
+class MemberListTest(TestCase):
+    def setUp(self):
+        self.kind = KindOfMembership.objects.create(name='Mitglied')
+        MembershipFee.objects.create(kind_of_membership=self.kind, amount=20,
+                                     start=datetime.date(2000, 1, 1))
+
+    def add_members(self, count):
+        for i in range(count):
+            user = User.objects.create(username=f'member{User.objects.count()}')
+            ContactInfo.objects.create(user=user)
+            MembershipPeriod.objects.create(user=user, begin=datetime.date(2010, 1, 1),
+                                            end=datetime.date(2012, 1, 1),
+                                            kind_of_membership=self.kind)
+            MembershipPeriod.objects.create(user=user, begin=datetime.date(2020, 3, i + 1),
+                                            kind_of_membership=self.kind)
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            annotate_member_debts(get_active_members())
+        return len(ctx.captured_queries)
+
+    def test_matches_contact_info(self):
+        self.add_members(3)
+        for user in annotate_member_debts(get_active_members()):
+            info = user.contactinfo
+            self.assertEqual(user.date_of_first_join, info.get_date_of_first_join())
+            self.assertEqual(user.monthly_fee, info.get_debt_for_this_month())
+            self.assertEqual(user.debts, info.get_debts())
+
+    def test_constant_number_of_queries(self):
+        self.add_members(2)
+        queries = self.count_queries()
+        self.add_members(8)
+        self.assertEqual(self.count_queries(), queries)
+
+    def test_member_list_page(self):
+        self.add_members(2)
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.force_login(admin)
+        response = self.client.get('/member/')
+        self.assertContains(response, 'member0')
+        self.assertContains(response, '20.00 Euro')
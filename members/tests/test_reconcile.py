@@ -0,0 +1,87 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from freezegun import freeze_time
+
+from members.models import BankCollectionMode, KindOfMembership, MembershipFee, \
+    MembershipPeriod, Payment, PaymentInfo, PaymentMethod
+from members.reconcile import Reconciler, get_name_tokens
+from members.tests.test_bank_import import erste_transaction
+
+
+@freeze_time('2023-07-20')
+class ReconcilerTest(TestCase):
+    def setUp(self):
+        kind = KindOfMembership.objects.create(name='Mitglied')
+        MembershipFee.objects.create(kind_of_membership=kind, amount=20,
+                                     start=datetime.date(2000, 1, 1))
+        mode = BankCollectionMode.objects.create(name='monthly', num_month=1)
+        method = PaymentMethod.objects.create(name='bank transfer')
+
+        self.members = {}
+        for username, first_name, last_name, iban, owner in [
+            ('joerg', 'Jörg', 'Müller', 'AT61 1904 3002 3457 3201', 'Jörg Müller'),
+            ('anna', 'Anna', 'Schmidt', '', ''),
+            ('max', 'Max', 'Mustermann', 'AT02 2011 1000 0000 1234', 'Erika Mustermann'),
+            ('max2', 'Max', 'Huber', '', ''),
+        ]:
+            user = User.objects.create(username=username, first_name=first_name, last_name=last_name)
+            MembershipPeriod.objects.create(user=user, kind_of_membership=kind,
+                                            begin=datetime.date(2020, 1, 1))
+            if iban:
+                PaymentInfo.objects.create(user=user, bank_collection_mode=mode,
+                                           bank_account_iban=iban, bank_account_owner=owner)
+            self.members[username] = user
+
+        Payment.objects.create(user=self.members['anna'], method=method, amount=20,
+                               date=datetime.date(2023, 6, 3), comment='Dauerauftrag Metalab A.S.')
+
+        self.reconciler = Reconciler.build()
+
+    def best(self, *args, **kwargs):
+        payment = erste_transaction(1, *args, **kwargs)
+        candidates = self.reconciler.score(payment)
+        return candidates[0].user.username if candidates else None, self.reconciler.is_confident(candidates)
+
+    def test_iban(self):
+        self.assertEqual(self.best('J. M.', 'AT611904300234573201'), ('joerg', True))
+
+    def test_sepa_token(self):
+        self.assertEqual(self.best('Bank', 'AT00', f'Rückleitung (u{self.members["anna"].pk})'),
+                         ('anna', True))
+
+    def test_earlier_payment(self):
+        self.assertEqual(self.best('Someone', 'AT00', 'Dauerauftrag  metalab A.S.', value=2500),
+                         ('anna', False))
+        self.assertEqual(self.best('Someone', 'AT00', 'Dauerauftrag  metalab A.S.', value=4000),
+                         ('anna', True))
+
+    def test_name(self):
+        self.assertEqual(self.best('MUELLER JOERG', 'AT00'), ('joerg', True))
+        self.assertEqual(self.best('Erika Mustermann', 'AT00'), ('max', True))
+        self.assertEqual(self.best('Max', 'AT00')[1], False)
+        self.assertEqual(self.best('Bank', 'AT00', 'Beitrag Anna Schmidt'), ('anna', False))
+
+    def test_unknown(self):
+        self.assertEqual(self.best('Wien Energie', 'AT00', 'Strom'), (None, False))
+
+    def test_scoring_does_not_query(self):
+        with self.assertNumQueries(0):
+            self.reconciler.score(erste_transaction(1, 'Jörg', 'AT611904300234573201', 'Beitrag (u1)'))
+
+    def test_kind_without_fee(self):
+        kind = KindOfMembership.objects.create(name='Förderer')
+        user = User.objects.create(username='sponsor', first_name='Susi', last_name='Sorglos')
+        MembershipPeriod.objects.create(user=user, kind_of_membership=kind,
+                                        begin=datetime.date(2020, 1, 1))
+        reconciler = Reconciler.build()
+
+        candidates = reconciler.score(erste_transaction(1, 'Susi Sorglos', 'AT00'))
+        self.assertEqual(candidates[0].user, user)
+        self.assertNotIn('amount', candidates[0].reasons)
+        self.assertIn('amount', reconciler.score(erste_transaction(1, 'Jörg Müller', 'AT00'))[0].reasons)
+
+    def test_name_tokens(self):
+        self.assertEqual(get_name_tokens('Jörg-Peter MÜLLER, Dr. Sánchez & A'),
+                         {'joerg', 'peter', 'mueller', 'dr', 'sanchez'})
@@ -0,0 +1,127 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.db.models import Q
+from django.test import TestCase
+from freezegun import freeze_time
+
+from members.management.commands.member_categories import Command as MemberCategoriesCommand
+from members.models import KindOfMembership, MembershipFee, MembershipPeriod, \
+    MembershipSnapshot, get_active_members_for
+from members.snapshots import get_member_history, get_membership_snapshots
+from members.util import get_list_of_history_entries
+
+
+@freeze_time('2023-07-20')
+class MembershipSnapshotTest(TestCase):
+    def setUp(self):
+        self.standard = KindOfMembership.objects.create(name='Mitglied')
+        self.reduced = KindOfMembership.objects.create(name='ermäßigt', fee_category='decreased')
+        self.fee = MembershipFee.objects.create(kind_of_membership=self.standard, amount=20,
+                                                start=datetime.date(2000, 1, 1))
+        MembershipFee.objects.create(kind_of_membership=self.reduced, amount=10,
+                                     start=datetime.date(2000, 1, 1))
+
+        self.periods = []
+        for i, periods in enumerate([
+            [(self.standard, datetime.date(2015, 1, 1), datetime.date(2020, 12, 31)),
+             (self.reduced, datetime.date(2021, 1, 1), None)],
+            [(self.standard, datetime.date(2018, 3, 15), datetime.date(2019, 2, 1)),
+             (self.standard, datetime.date(2022, 3, 1), None)],
+            [(self.reduced, datetime.date(2019, 1, 1), datetime.date(2023, 1, 1)),
+             (self.standard, datetime.date(2023, 1, 1), None)],
+        ]):
+            user = User.objects.create(username=f'member{i}')
+            for kind, begin, end in periods:
+                self.periods.append(MembershipPeriod.objects.create(
+                    user=user, kind_of_membership=kind, begin=begin, end=end))
+
+        self.months = [datetime.date(year, month, 1)
+                       for year in range(2014, 2024) for month in range(1, 13)]
+
+    def assertMatchesRawData(self):
+        history = get_list_of_history_entries()
+        snapshots = get_membership_snapshots(self.months)
+
+        for month in self.months:
+            snapshot = snapshots[month]
+            he = history.get(month)
+            self.assertEqual(
+                (snapshot.num_member, snapshot.new_member, snapshot.resigned_member),
+                (he.num_member, he.new_member, he.resigned_member) if he else (0, 0, 0),
+            )
+
+            periods = MembershipPeriod.objects.filter(Q(begin__lte=month), Q(end__isnull=True) | Q(end__gte=month))
+            rows = {row.kind_of_membership_id: row for row in snapshot.kind_rows}
+            for kind in (self.standard, self.reduced):
+                count = periods.filter(kind_of_membership=kind).count()
+                self.assertEqual(rows[kind.pk].periods if kind.pk in rows else 0, count)
+
+            _, members = MemberCategoriesCommand().handle_snapshot(
+                snapshot, KindOfMembership.objects.in_bulk())
+            expected_members = {}
+            for user in get_active_members_for(month):
+                period = user.membershipperiod_set.filter(
+                    Q(begin__lte=month), Q(end__isnull=True) | Q(end__gte=month)).first()
+                name = period.kind_of_membership.name
+                expected_members[name] = expected_members.get(name, 0) + 1
+            self.assertEqual(members, sum(expected_members.values()))
+
+    def test_snapshots_match_raw_data(self):
+        self.assertMatchesRawData()
+
+    def test_closed_months_are_stored(self):
+        get_membership_snapshots(self.months)
+        self.assertEqual(MembershipSnapshot.objects.count(), len(self.months) - 6)
+        with self.assertNumQueries(2):
+            get_membership_snapshots(self.months[:-6])
+
+    def test_period_change_invalidates_snapshots(self):
+        get_membership_snapshots(self.months)
+        period = self.periods[0]
+        period.end = datetime.date(2016, 6, 30)
+        period.save()
+        self.assertFalse(MembershipSnapshot.objects.filter(month__gte=datetime.date(2015, 1, 1)).exists())
+        self.assertTrue(MembershipSnapshot.objects.filter(month__lt=datetime.date(2015, 1, 1)).exists())
+        self.assertMatchesRawData()
+
+    def test_loaddata_keeps_snapshots(self):
+        get_membership_snapshots(self.months)
+        count = MembershipSnapshot.objects.count()
+        period = self.periods[0]
+        period.end = datetime.date(2016, 6, 30)
+        period.save_base(raw=True)
+        self.fee.save_base(raw=True)
+        self.assertEqual(MembershipSnapshot.objects.count(), count)
+
+    def test_fee_change_invalidates_snapshots(self):
+        get_membership_snapshots(self.months)
+        self.fee.amount = 25
+        self.fee.save()
+        snapshot = get_membership_snapshots([datetime.date(2016, 1, 1)])[datetime.date(2016, 1, 1)]
+        self.assertEqual(snapshot.kind_rows[0].fees, 25)
+
+    def test_history_view(self):
+        response = self.client.get('/member/history/')
+        self.assertContains(response, '<td><p>3</p></td>')
+
+    def test_history_json(self):
+        history = self.client.get('/member/history.json').json()
+        self.assertEqual(history[0], {'month': '2006-03', 'num_member': 0,
+                                      'new_member': 0, 'resigned_member': 0})
+        self.assertEqual(history[-1]['month'], '2023-07')
+        self.assertEqual(history[-1]['num_member'], 3)
+
+        MembershipPeriod.objects.filter(end__isnull=True).update(end=datetime.date(2023, 7, 1))
+        self.periods[0].save()
+        history = self.client.get('/member/history.json').json()
+        self.assertEqual(history[-1]['num_member'], 0)
+
+    def test_history_is_computed_with_one_query(self):
+        with self.assertNumQueries(1):
+            get_list_of_history_entries()
+
+    def test_history_is_cached(self):
+        get_member_history()
+        with self.assertNumQueries(0):
+            get_member_history()
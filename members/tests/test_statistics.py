@@ -0,0 +1,96 @@
+import datetime
+from collections import defaultdict
+
+from dateutil.relativedelta import relativedelta
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Q, Sum
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from freezegun import freeze_time
+
+from members.models import KindOfMembership, MembershipFee, MembershipPeriod, \
+    Payment, PaymentMethod, get_month_list
+from members.statistics import get_monthly_statistics
+
+
+def get_monthly_statistics_per_month(start_date, end_date):
+    """The month by month computation the sweep replaces."""
+    fees = list(MembershipFee.objects.all())
+    result = []
+    for month in get_month_list(start_date, end_date):
+        month_statistics = {
+            "month": month,
+            "spind_kinds": defaultdict(int),
+            "fee_category_kinds": defaultdict(int),
+            "total_fees": 0,
+            "total_fees_spind": 0,
+            "total_fees_membership": 0,
+        }
+        periods = MembershipPeriod.objects.filter(Q(begin__lte=month), Q(end__isnull=True) | Q(end__gte=month))
+        for kind in KindOfMembership.objects.all():
+            count = periods.filter(kind_of_membership=kind).count()
+            if count > 0:
+                month_statistics["spind_kinds"][kind.get_spind_display()] += count
+                month_statistics["fee_category_kinds"][kind.get_fee_category_display()] += count
+        for period in periods:
+            fee_spind = period.kind_of_membership.spind_fee
+            fee_membership = period.get_membership_fee(month, fees).amount - fee_spind
+            month_statistics["total_fees"] += fee_spind + fee_membership
+            month_statistics["total_fees_spind"] += fee_spind
+            month_statistics["total_fees_membership"] += fee_membership
+        month_statistics["total_payments"] = Payment.objects.filter(
+            date__gte=month,
+            date__lt=month + relativedelta(months=1),
+        ).aggregate(Sum('amount'))['amount__sum'] or 0
+        month_statistics["spind_kinds"] = dict(month_statistics["spind_kinds"])
+        month_statistics["fee_category_kinds"] = dict(month_statistics["fee_category_kinds"])
+        result.append(month_statistics)
+    return result
+
+
+@freeze_time('2023-07-20')
+class MonthlyStatisticsTest(TestCase):
+    def setUp(self):
+        method = PaymentMethod.objects.create(name='bank transfer')
+        standard = KindOfMembership.objects.create(name='Mitglied')
+        spind = KindOfMembership.objects.create(name='Mitglied mit Spind', spind='big_1')
+        free = KindOfMembership.objects.create(name='Ehrenmitglied', fee_category='free')
+        MembershipFee.objects.create(kind_of_membership=standard, amount=20,
+                                     start=datetime.date(2000, 1, 1), end=datetime.date(2021, 12, 31))
+        MembershipFee.objects.create(kind_of_membership=standard, amount=25,
+                                     start=datetime.date(2022, 1, 1))
+        MembershipFee.objects.create(kind_of_membership=spind, amount=35,
+                                     start=datetime.date(2000, 1, 1))
+        MembershipFee.objects.create(kind_of_membership=free, amount=0,
+                                     start=datetime.date(2000, 1, 1))
+
+        for i, (kind, begin, end) in enumerate([
+            (standard, datetime.date(2015, 1, 1), None),
+            (standard, datetime.date(2020, 5, 12), datetime.date(2021, 3, 1)),
+            (spind, datetime.date(2021, 3, 2), None),
+            (spind, datetime.date(2019, 1, 1), datetime.date(2022, 6, 30)),
+            (free, datetime.date(2021, 7, 1), datetime.date(2021, 7, 1)),
+            (standard, datetime.date(2022, 7, 1), None),
+        ]):
+            user = User.objects.create(username=f'member{i}')
+            MembershipPeriod.objects.create(user=user, kind_of_membership=kind,
+                                            begin=begin, end=end)
+            Payment.objects.create(user=user, method=method, amount=10 * i,
+                                   date=begin + relativedelta(days=3))
+
+    def test_matches_per_month_computation(self):
+        start_date = datetime.date(2019, 1, 1)
+        end_date = datetime.date(2023, 7, 1)
+        self.assertEqual(get_monthly_statistics(start_date, end_date),
+                         get_monthly_statistics_per_month(start_date, end_date))
+
+    def test_constant_number_of_queries(self):
+        def count_queries(start_date):
+            get_monthly_statistics(start_date, datetime.date(2023, 7, 1))  # store the snapshots
+            with CaptureQueriesContext(connection) as ctx:
+                get_monthly_statistics(start_date, datetime.date(2023, 7, 1))
+            return len(ctx.captured_queries)
+
+        self.assertEqual(count_queries(datetime.date(2023, 1, 1)),
+                         count_queries(datetime.date(2013, 1, 1)))
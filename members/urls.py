@@ -1,7 +1,5 @@
 from django.urls import path, re_path, include
-from django.views.generic.list import ListView
 
-from .models import get_active_members
 import members.views
 
 username_patterns = [
@@ -11,22 +9,19 @@ username_patterns = [
 ]
 
 urlpatterns = [
-    path('',
-         ListView.as_view(
-             queryset=get_active_members().prefetch_related("contactinfo"),
-             template_name='members/member_list.html',
-        ),
-    ),
+    path('', members.views.MemberListView.as_view()),
 
     path('', include('django.contrib.auth.urls')),
 
     re_path(r'^valid_user/?$', members.views.valid_user),
     path('history/', members.views.members_history),
+    path('history.json', members.views.members_history_json),
     path('hetti/', members.views.hetti),
     path('bank/', members.views.members_bank),
     path('bank/json/import', members.views.members_bank_json_import),
     path('bank/json/match', members.views.members_bank_json_match),
     path('keylist/', members.views.members_key_list),
+    path('keylist/delta/', members.views.members_key_list_delta),
     path('lazzzorlist/', members.views.members_lazzzor_list),
     path('internlist/', members.views.members_intern_list),
 
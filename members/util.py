@@ -1,8 +1,9 @@
 from datetime import date, timedelta
+from itertools import groupby
+from operator import itemgetter
 
 from dateutil.relativedelta import relativedelta
 from dateutil.rrule import rrule, MONTHLY
-from django.contrib.auth.models import User
 
 from .models import MembershipPeriod
 
@@ -38,12 +39,11 @@ def get_list_of_history_entries():
         he_list[d] = HistoryEntry()
         he_list[d].month = d
 
-    for u in User.objects.all():
-        mps = u.membershipperiod_set.values_list('begin', 'end')
-        if not mps:
-            continue
+    periods = MembershipPeriod.objects.order_by('user_id', 'pk') \
+        .values_list('user_id', 'begin', 'end')
 
-        starts, ends = zip(*mps)
+    for user_id, mps in groupby(periods.iterator(), key=itemgetter(0)):
+        _, starts, ends = zip(*mps)
         starts = list(starts) + [None]
         ends = [None] + list(ends)
 
@@ -1,43 +1,70 @@
-from collections import defaultdict
 from datetime import date, datetime, timedelta
+import time
 from typing import DefaultDict
 from dateutil import relativedelta
-from sepaxml import SepaDD
-import json
 
-from dateutil.rrule import rrule, MONTHLY
+from asgiref.sync import sync_to_async
 from django.contrib import messages
 from django.db.models import Q
-from django.db.models import Sum
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 from django.contrib.auth.decorators import login_required
 from django.db import transaction
 from django.views.decorators.csrf import csrf_exempt
-from django.http import HttpResponse, Http404, HttpResponseNotAllowed, HttpResponseBadRequest
+from django.http import HttpResponse, Http404, HttpResponseNotAllowed, HttpResponseBadRequest, \
+    JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.utils.cache import patch_cache_control
+from django.views.generic.list import ListView
 from django.conf import settings
 
+from core.cache import conditional_response
 from .forms import UserEmailForm, UserNameForm, UserAdressForm,\
     UserImageForm, UserInternListForm
 from .models import ContactInfo, get_active_members, \
-    get_active_and_future_members, Payment, PendingPayment, PaymentMethod, \
-    get_mailinglist_members, get_month_list, KindOfMembership, \
-    MembershipPeriod, MembershipFee, BankImportMatcher
-from .util import get_list_of_history_entries
+    Payment, PendingPayment, PaymentMethod, PaymentInfo, \
+    annotate_member_debts, get_monthly_fees, update_member_balances
+from .importers import IMPORTERS, BankImportError, read_bank_statement
+from .lists import get_cached_key_list_version, get_cached_member_list, \
+    get_key_list_delta, get_member_list
+from .matching import get_bank_import_rules, get_imported_references
+from .reconcile import Reconciler
+from .sepa import SepaDDStream
+from .snapshots import get_member_history
+from .statistics import get_monthly_statistics
 
 
-def members_history(request):
-    history_entry_list = get_list_of_history_entries()
-    months = list(rrule(MONTHLY, dtstart=date(2006, 3, 1), until=date.today()))
+class MemberListView(ListView):
+    template_name = 'members/member_list.html'
+
+    def get_queryset(self):
+        return get_active_members().prefetch_related("contactinfo")
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        if self.request.user.is_superuser:
+            context['object_list'] = annotate_member_debts(context['object_list'])
+        return context
 
-    history_list = [history_entry_list[dt.date()] for dt in months]
 
-    history_list.reverse()
+def members_history(request):
+    history_list = list(reversed(get_member_history()))
     context = {'list': history_list}
     return render(request, 'members/members_history.html', context)
 
 
+def members_history_json(request):
+    return JsonResponse([
+        {
+            'month': entry['month'].strftime('%Y-%m'),
+            'num_member': entry['num_member'],
+            'new_member': entry['new_member'],
+            'resigned_member': entry['resigned_member'],
+        }
+        for entry in get_member_history()
+    ], safe=False)
+
+
 @login_required
 def hetti(request):
     if not request.user.is_superuser:
@@ -60,49 +87,7 @@ def hetti(request):
     except Exception as ex:
         return HttpResponseBadRequest(str(ex), content_type="text/plain")
 
-    months = []
-
-    # all of the following is very slow, but we're only dealing with 24 months
-    fees = list(MembershipFee.objects.all())
-
-    for month in get_month_list(start_date, end_date):
-        first_day_of_month = month
-        first_day_of_next_month = month + relativedelta.relativedelta(months=1)
-
-        month_statistics = {
-            "month": month,
-            "spind_kinds": defaultdict(int),
-            "fee_category_kinds": defaultdict(int),
-        }
-
-        periods = MembershipPeriod.objects.filter(Q(begin__lte=month), Q(end__isnull=True) | Q(end__gte=month))
-
-        for kind in KindOfMembership.objects.all():
-            count = periods.filter(kind_of_membership=kind).count()
-            if count > 0:
-                month_statistics["spind_kinds"][kind.get_spind_display()] += count
-                month_statistics["fee_category_kinds"][kind.get_fee_category_display()] += count
-
-        month_statistics["total_fees"] = 0
-        month_statistics["total_fees_spind"] = 0
-        month_statistics["total_fees_membership"] = 0
-
-        for period in periods:
-            fee_spind = period.kind_of_membership.spind_fee
-            fee_membership = period.get_membership_fee(month, fees).amount - fee_spind
-
-            month_statistics["total_fees"] += fee_spind + fee_membership
-            month_statistics["total_fees_spind"] += fee_spind
-            month_statistics["total_fees_membership"] += fee_membership
-
-        month_statistics["total_payments"] = Payment.objects.filter(
-            date__gte=first_day_of_month,
-            date__lt=first_day_of_next_month,
-        ).aggregate(Sum('amount'))['amount__sum'] or 0
-
-        month_statistics["spind_kinds"] = dict(month_statistics["spind_kinds"])
-        month_statistics["fee_category_kinds"] = dict(month_statistics["fee_category_kinds"])
-        months.append(month_statistics)
+    months = get_monthly_statistics(start_date, end_date)
 
     context = {'months': months}
     return render(request, 'members/members_hetti.html', context)
@@ -169,16 +154,40 @@ def members_update(request, user_username, update_type):
 def members_bank(request):
     if not request.user.is_superuser:
         return HttpResponseNotAllowed('you are not allowed to use this method')
-    return render(request, 'members/member_bank.html')
+    return render(request, 'members/member_bank.html', context={
+        "importers": [(key, label) for key, (label, reader) in IMPORTERS.items()],
+    })
 
 class SepaException(Exception):
     pass
 
 def generate_sepa(admin_user, members_to_collect_from):
+    """
+    Adds a direct debit for every member with a fee this month and stores
+    them as PendingPayments. Returns the SepaDDStream, its file name and a list
+    of (stage, seconds) timings.
+    """
+    timings = []
+    stage_start = time.time()
+
+    def stage_done(stage):
+        nonlocal stage_start
+        now = time.time()
+        timings.append((stage, now - stage_start))
+        stage_start = now
+
+    members_to_collect_from = list(
+        members_to_collect_from.select_related('paymentinfo', 'contactinfo')
+    )
     if len(members_to_collect_from) == 0:
         raise SepaException("no members to collect from.")
+    stage_done('fetch members')
 
-    sepa = SepaDD({
+    today = date.today()
+    debts = get_monthly_fees([member.pk for member in members_to_collect_from], today)
+    stage_done('compute debts')
+
+    sepa = SepaDDStream({
         "name": settings.HOS_SEPA_CREDITOR_NAME,
         "IBAN": settings.HOS_SEPA_CREDITOR_IBAN,
         "BIC": settings.HOS_SEPA_CREDITOR_BIC,
@@ -188,27 +197,30 @@ def generate_sepa(admin_user, members_to_collect_from):
         "instrument": 'CORE'
     }, schema=settings.HOS_SEPA_SCHEMA)
 
-    sepaxml_filename = f'metalab_sepa_{date.today().year}_{format(date.today().month, "02")}.xml'
+    sepaxml_filename = f'metalab_sepa_{today.year}_{format(today.month, "02")}.xml'
     payment_comment = f'{sepaxml_filename} exported {datetime.now().replace(microsecond=0).isoformat()} by {admin_user.username}'
     payment_method = PaymentMethod.objects.get(name='bank collection')
 
     if not payment_method:
         raise SepaException("could not find PaymentMethod 'bank collection'")
 
+    signed_mandates = []
+    pending_payments = []
+
     for member in members_to_collect_from:
-        debt = member.contactinfo.get_debt_for_month(date.today())
+        debt = debts[member.pk]
 
         if debt > 0:
             pmi = member.paymentinfo
             # on the first debit initiation, set the mandate signing date
             if not pmi.bank_account_date_of_signing:
-                pmi.bank_account_date_of_signing = date.today()
-                pmi.save()
+                pmi.bank_account_date_of_signing = today
+                signed_mandates.append(pmi)
                 payment_type = "FRST"
-                collection_date = date.today() + timedelta(days=+5)
+                collection_date = today + timedelta(days=+5)
             else:
                 payment_type = "RCUR"
-                collection_date = date.today() + timedelta(days=+3)
+                collection_date = today + timedelta(days=+3)
 
             sepa.add_payment({
                 "name": pmi.bank_account_owner,
@@ -218,99 +230,128 @@ def generate_sepa(admin_user, members_to_collect_from):
                 "type": payment_type,
                 "collection_date": collection_date,
                 "amount": debt * 100,  # in cents
-                "execution_date": date.today(),
-                "description": f'Mitgliedsbeitrag {date.today().year}/{date.today().month} (u{member.id})',
+                "execution_date": today,
+                "description": f'Mitgliedsbeitrag {today.year}/{today.month} (u{member.id})',
             })
 
-            PendingPayment.objects.create(
+            pending_payments.append(PendingPayment(
                 date = collection_date,
                 user = member,
                 amount = debt,
                 method = payment_method,
                 original_file = sepa.msg_id,
                 comment = payment_comment,
-            )
+            ))
+    stage_done('build payments')
+
+    PaymentInfo.objects.bulk_update(signed_mandates, ['bank_account_date_of_signing'])
+    stage_done(f'update {len(signed_mandates)} mandates')
+
+    PendingPayment.objects.bulk_create(pending_payments)
+    stage_done(f'create {len(pending_payments)} pending payments')
+
+    return sepa, sepaxml_filename, timings
+
+
+def get_bank_import_row(payment, rules, rule_members):
+    """
+    Prepares a transaction (see members.importers) for the bank import page,
+    returns None if it isn't shown.
+    """
+    if not payment["partnerName"]:
+        return None
+    if payment["amount"]["currency"] != "EUR":
+        return None
+
+    if "iban" not in (payment.get("partnerAccount") or {}):
+        return None
+
+    payment["amount"]["value_full"] = payment["amount"]["value"] / pow(10, payment["amount"]["precision"])
+    payment["booking"] = datetime.fromisoformat(payment["booking"])
+    payment["text"] = (payment["reference"] + " " + payment["receiverReference"]).strip()
+
+    should_drop = False
+    should_match = (payment["amount"]["value_full"] > 0 or "Rückleitung" in payment["reference"])
+    color = ""
+    matched_members = []
+
+    fields = [
+        payment["partnerName"],
+        payment["partnerAccount"]["iban"],
+        payment["text"],
+    ]
+
+    for rule in rules.match(fields):
+        if rule.action == "color" and rule.color:
+            color = rule.color
+        elif rule.action == "do_not_match":
+            should_match = False
+        elif rule.action == "match_to" and rule.member_id in rule_members:
+            matched_members = [rule_members[rule.member_id]]
+            should_match = False
+        elif rule.action == "drop":
+            should_drop = True
+
+    if should_drop:
+        return None
+
+    return {
+        "payment": payment,
+        "matched_members": matched_members,
+        "color": color,
+        "should_match": should_match,
+    }
 
-    return sepa, sepaxml_filename
 
 @login_required
 def members_bank_json_import(request):
     if not request.user.is_superuser:
         return HttpResponseNotAllowed('you are not allowed to use this method')
-    if request.method != "POST" or not 'erstejson' in request.FILES:
+    # erstejson is the field name of the form before other formats were
+    # supported, scripts may still post it
+    statement = request.FILES.get('statement') or request.FILES.get('erstejson')
+    if request.method != "POST" or statement is None:
         messages.error(request, 'No file found.')
         return redirect("/member/bank/")
 
+    rules = get_bank_import_rules()
+    rule_members = User.objects.in_bulk(rules.member_ids)
+
     try:
-        payments = json.load(request.FILES['erstejson'])
-    except json.JSONDecodeError:
-        messages.error(request, 'could not parse JSON data')
+        import_rows = [
+            row for row in (
+                get_bank_import_row(payment, rules, rule_members)
+                for payment in read_bank_statement(statement, request.POST.get('format', 'erste_json'))
+            )
+            if row is not None
+        ]
+    except BankImportError as e:
+        messages.error(request, str(e))
         return redirect("/member/bank/")
 
-    matchers = list(BankImportMatcher.objects.all())
-
-    import_rows = []
+    imported_references = get_imported_references(
+        row["payment"]["referenceNumber"] for row in import_rows)
+    reconciler = Reconciler.build()
 
-    for payment in payments:
-        if not payment["partnerName"]:
-            continue
-        if payment["amount"]["currency"] != "EUR":
-            continue
-
-        try:
-            iban = payment["partnerAccount"]["iban"]
-        except LookupError:
-            continue
-
-        payment["amount"]["value_full"] = payment["amount"]["value"] / pow(10, payment["amount"]["precision"])
-        payment["booking"] = datetime.fromisoformat(payment["booking"])
-        payment["text"] = (payment["reference"] + " " + payment["receiverReference"]).strip()
-
-        should_drop = False
-        should_match = (payment["amount"]["value_full"] > 0 or "Rückleitung" in payment["reference"])
-        color = ""
-        matched_members = []
-
-        for matcher in matchers:
-            fields = [
-                payment["partnerName"],
-                payment["partnerAccount"]["iban"],
-                payment["text"],
-            ]
-
-            if any(matcher.matcher in f for f in fields):
-                if matcher.action == "color" and matcher.color:
-                    color = matcher.color
-                elif matcher.action == "do_not_match":
-                    should_match = False
-                elif matcher.action == "match_to" and matcher.member:
-                    matched_members = [matcher.member]
-                    should_match = False
-                elif matcher.action == "drop":
-                    should_drop = True
-
-        if should_drop:
-            continue
-
-        if Payment.objects.filter(original_line=payment["referenceNumber"]).exists():
-            color = "rgba(0, 0, 0, 0.2)"
-            should_match = False
+    for row in import_rows:
+        if str(row["payment"]["referenceNumber"]) in imported_references:
+            row["color"] = "rgba(0, 0, 0, 0.2)"
+            row["should_match"] = False
 
-        if should_match:
-            matched_members = User.objects.filter(paymentinfo__bank_account_iban=iban)
-
-        import_rows.append({
-            "payment": payment,
-            "matched_members": matched_members,
-            "color": color,
-        })
+        if row["should_match"]:
+            candidates = reconciler.score(row["payment"])
+            row["candidates"] = candidates[:3]
+            if reconciler.is_confident(candidates):
+                row["matched_members"] = [candidates[0].user]
+            else:
+                row["needs_review"] = True
 
     all_members = User.objects.filter(Q(membershipperiod__isnull=False)).distinct()
 
     return render(request, 'members/member_bank_json_match.html', context={
         "import_rows": import_rows,
         "all_members": all_members,
-        "upload_filename": request.FILES['erstejson'].name,
+        "upload_filename": statement.name,
     })
 
 
@@ -330,67 +371,101 @@ def members_bank_json_match(request):
         "date",
     ]
 
-    lines = [
-        {f: request.POST.getlist(f + "[]")[r] for f in fields}
-        for r in range(len(request.POST.getlist(fields[0] + "[]")))
-    ]
+    columns = [request.POST.getlist(f + "[]") for f in fields]
+    if len(set(map(len, columns))) != 1:
+        messages.error(request, 'Incomplete data, nothing imported.')
+        return redirect("/member/bank/")
+    lines = [dict(zip(fields, values)) for values in zip(*columns)]
 
     bank_collection = PaymentMethod.objects.get(name="bank collection")
     bank_transfer = PaymentMethod.objects.get(name="bank transfer")
 
-    count = 0
+    # skip lines which have been imported before, e.g. when the form is
+    # submitted twice
+    imported_references = get_imported_references(line["referenceNumber"] for line in lines)
+    new_payments = []
 
     for line in lines:
-        if not line["member_pk"]:
+        if not line["member_pk"] or line["referenceNumber"] in imported_references:
             continue
+        imported_references.add(line["referenceNumber"])
 
-        # all of MOS money is in float. don't ask.
-        line["value"] = float(line["value"])
-
-        Payment.objects.create(
-            date=datetime.strptime(line["date"], "%Y-%m-%d"),
-            user_id=line["member_pk"],
+        try:
+            # all of MOS money is in float. don't ask.
+            line["value"] = float(line["value"])
+            booking = datetime.strptime(line["date"], "%Y-%m-%d")
+            user_id = int(line["member_pk"])
+        except ValueError as e:
+            messages.error(request, f'Invalid line {line["referenceNumber"]}: {e}, nothing imported.')
+            return redirect("/member/bank/")
+
+        new_payments.append(Payment(
+            date=booking,
+            user_id=user_id,
             amount=line["value"],
             comment=line["text"][:200],
             # Rückleitungen als BankCollection, alle anderen BankTransfer
             method=bank_collection if line["value"] < 0 else bank_transfer,
             original_file=request.POST["upload_filename"],
             original_line=line["referenceNumber"],
-        )
-        count += 1
+        ))
+
+    with transaction.atomic():
+        Payment.objects.bulk_create(new_payments)
+        # bulk_create doesn't send the signals which update the balances
+        update_member_balances({payment.user_id for payment in new_payments})
+
+    count = len(new_payments)
 
     messages.success(request, f"imported {count} payments from {request.POST['upload_filename']}")
 
     return redirect("/member/bank")
 
 
-def members_key_list(request):
-    # get active members with active keys
-    members_with_keys = get_active_and_future_members().filter(contactinfo__has_active_key=True).filter(contactinfo__key_id__isnull=False)
+async def member_list_response(request, name):
+    # the cached list takes no query, so only building it needs a thread
+    member_list = get_cached_member_list(name)
+    if member_list is None:
+        member_list = await sync_to_async(get_member_list)(name)
+    text, etag = member_list
+    return conditional_response(request, text, 'text/plain', etag, max_age=0, private=True)
+
 
-    # just output keys one line per key
-    text = '\r\n'.join([x.contactinfo.key_id for x in members_with_keys])
-    return HttpResponse(text, content_type='text/plain')
+async def members_key_list(request):
+    return await member_list_response(request, 'keylist')
 
 
-def members_lazzzor_list(request):
+async def members_key_list_delta(request):
+    """
+    Returns the keys added to and removed from the key list since the
+    version given as ?since=, or the whole key list if it is unknown.
+    """
+    try:
+        since = int(request.GET['since'])
+    except (KeyError, ValueError):
+        since = None
+
+    # an up to date client gets its answer from the cache without a query,
+    # anything else may have to sync the change log
+    if since is not None and since == get_cached_key_list_version():
+        delta = {'version': since, 'snapshot': False, 'add': [], 'remove': []}
+    else:
+        delta = await sync_to_async(get_key_list_delta)(since)
+    response = JsonResponse(delta)
+    patch_cache_control(response, private=True, max_age=0)
+    return response
+
+
+async def members_lazzzor_list(request):
     """
     Returns key ids and usernames of members with lazzzor privileges as
     comma separated list."""
-    members_with_privs = get_active_and_future_members().filter(
-        contactinfo__has_lazzzor_privileges=True).filter(contactinfo__key_id__isnull=False)
-
-    result = ['%s,%s,%s' % (m.contactinfo.key_id, m.username,
-                            m.contactinfo.lazzzor_rate)
-                  for m in members_with_privs]
-    return HttpResponse('\r\n'.join(result), content_type='text/plain')
-
-def members_intern_list(request):
-    members_on_intern = get_mailinglist_members() \
-        .filter(contactinfo__on_intern_list = True) \
-        .exclude(contactinfo__intern_list_email = '')
-    addresses = [m.contactinfo.intern_list_email for m in members_on_intern]
-    return HttpResponse('\r\n'.join(addresses), content_type='text/plain')
+    return await member_list_response(request, 'lazzzorlist')
+
+
+async def members_intern_list(request):
+    return await member_list_response(request, 'internlist')
+
 
 def members_update_userpic(request, user_username):
     if not request.user.username == user_username:
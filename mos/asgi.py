@@ -18,11 +18,16 @@ django.setup()
 
 django_asgi_app = get_asgi_application()
 
+import cal.routing  # noqa: E402 needs the apps to be loaded
+import web.routing  # noqa: E402
+
 application = ProtocolTypeRouter({
     # Django's ASGI application to handle traditional HTTP requests
     "http": django_asgi_app,
     "websocket": AuthMiddlewareStack(
-        URLRouter([
-        ])
+        URLRouter(
+            cal.routing.websocket_urlpatterns +
+            web.routing.websocket_urlpatterns
+        )
     ),
 })
\ No newline at end of file
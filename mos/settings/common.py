@@ -7,7 +7,14 @@ BASE_DIR = Path(__file__).absolute().ancestor(3)
 DEBUG = False
 TEST_RUNNER = 'django.test.runner.DiscoverRunner'
 
-ASGI_APPLICATION = "mos.routing.application"
+ASGI_APPLICATION = "mos.asgi.application"
+
+# pushes e.g. the open state to websocket clients of the same process
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    },
+}
 
 ADMINS = (
     # ('Your Name', 'your_email@example.com'),
@@ -151,6 +158,9 @@ HOS_EMAIL_LOG = '../email.log'
 MOS_WIKI_CHANGE_URL = 'https://metalab.at/wiki/index.php?title=Spezial:Letzte_%C3%84nderungen&feed=atom'
 MOS_WIKI_KEEP = 5
 
+# token the door sends to /spaceapi/state, blank to disable it
+MOS_SPACE_STATE_TOKEN = ''
+
 # ----------------- Style ---------------------
 HOS_CUSTOM_STYLE = ''  # name of the custom style, blank for default
 HOS_MEMBER_GALLERY = True
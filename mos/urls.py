@@ -23,6 +23,7 @@ urlpatterns = [
     path('announce/', include('announce.urls')),
     path('cellardoor/', web.views.display_cellardoor),
     path('spaceapi.json', web.views.spaceapi),
+    path('spaceapi/state', web.views.space_state),
     path('', web.views.display_main_page),
     path('mos', web.views.display_main_page),
 ]
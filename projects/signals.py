@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from core.cache import bump_data_version
+from .models import Project
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def bump_projects_version(sender, instance, **kwargs):
+    bump_data_version('projects')
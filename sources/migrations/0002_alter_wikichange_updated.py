@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sources', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='wikichange',
+            name='updated',
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
@@ -5,7 +5,7 @@ class WikiChange(models.Model):
     title = models.CharField(max_length=200)
     link = models.CharField(max_length=300)
     author = models.CharField(max_length=300)
-    updated = models.DateTimeField()
+    updated = models.DateTimeField(db_index=True)
 
     def __str__(self):
         return '%s: %s' % (self.author, self. title)
@@ -0,0 +1,21 @@
+from asgiref.sync import async_to_sync
+from channels.generic.websocket import JsonWebsocketConsumer
+
+from .space_state import SPACE_STATE_GROUP, get_space_state
+
+
+class SpaceStateConsumer(JsonWebsocketConsumer):
+    """
+    Sends the open state of the space on connect and whenever it changes.
+    """
+
+    def connect(self):
+        async_to_sync(self.channel_layer.group_add)(SPACE_STATE_GROUP, self.channel_name)
+        self.accept()
+        self.send_json(get_space_state())
+
+    def disconnect(self, code):
+        async_to_sync(self.channel_layer.group_discard)(SPACE_STATE_GROUP, self.channel_name)
+
+    def space_state(self, event):
+        self.send_json(event['state'])
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:19
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpaceStateChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('open', models.BooleanField()),
+                ('changed_at', models.DateTimeField(db_index=True, default=datetime.datetime.now)),
+            ],
+        ),
+    ]
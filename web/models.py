@@ -0,0 +1,14 @@
+import datetime
+
+from django.db import models
+
+
+class SpaceStateChange(models.Model):
+    """
+    A change of the open state reported by the door (see web.space_state)
+    """
+    open = models.BooleanField()
+    changed_at = models.DateTimeField(default=datetime.datetime.now, db_index=True)
+
+    def __str__(self):
+        return '%s: %s' % (self.changed_at, 'open' if self.open else 'closed')
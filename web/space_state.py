@@ -0,0 +1,53 @@
+"""
+The open state of the space, as reported by the door to /spaceapi/state.
+
+The current state is kept in the cache, only the changes are stored, so
+serving it in spaceapi.json takes no query. Changes are pushed to the
+websocket clients of web.consumers.SpaceStateConsumer.
+"""
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+
+from core.cache import bump_data_version
+from .models import SpaceStateChange
+
+SPACE_STATE_CACHE_KEY = 'web.space_state'
+SPACE_STATE_GROUP = 'space_state'
+
+
+def get_space_state():
+    """
+    Returns {'open': True, False or None if unknown, 'lastchange': unix time
+    of the change or None}.
+    """
+    state = cache.get(SPACE_STATE_CACHE_KEY)
+    if state is None:
+        change = SpaceStateChange.objects.order_by('-changed_at', '-pk').first()
+        state = {
+            'open': change.open if change else None,
+            'lastchange': int(time.mktime(change.changed_at.timetuple())) if change else None,
+        }
+        cache.set(SPACE_STATE_CACHE_KEY, state, None)
+    return state
+
+
+def set_space_state(is_open):
+    state = get_space_state()
+    if state['open'] == is_open:
+        return state
+
+    change = SpaceStateChange.objects.create(open=is_open)
+    state = {'open': is_open, 'lastchange': int(time.mktime(change.changed_at.timetuple()))}
+    cache.set(SPACE_STATE_CACHE_KEY, state, None)
+    bump_data_version('space_state')
+
+    channel_layer = get_channel_layer()
+    if channel_layer is not None:
+        async_to_sync(channel_layer.group_send)(SPACE_STATE_GROUP, {
+            'type': 'space.state',
+            'state': state,
+        })
+    return state
@@ -1,8 +1,17 @@
 import time
 
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.test import TestCase, override_settings
 from django.test.client import Client
 
+from projects.models import Project
+from .consumers import SpaceStateConsumer
+from .models import SpaceStateChange
+from .space_state import get_space_state, set_space_state
+
 
 class PerformanceMainPageTest(TestCase):
 
@@ -19,3 +28,70 @@ class PerformanceMainPageTest(TestCase):
 
                 log_str = 'MainPage :  %f \n ' % (load_time)
                 log_file.write(log_str)
+
+
+class SpaceApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='admin')
+
+    def testCachedUntilAProjectChanges(self):
+        project = Project.objects.create(name='Lötstation', wikiPage='Loetstation', created_by=self.user)
+        response = self.client.get('/spaceapi.json')
+        self.assertEqual(response.json()['projects'], ['https://metalab.at/wiki/Loetstation'])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/spaceapi.json', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        project.delete()
+        self.assertEqual(self.client.get('/spaceapi.json').json()['projects'], [])
+
+
+@override_settings(MOS_SPACE_STATE_TOKEN='door')
+class SpaceStateTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def post(self, value, token='door'):
+        return self.client.post('/spaceapi/state', {'open': value}, HTTP_AUTHORIZATION=f'Token {token}')
+
+    def testToken(self):
+        self.assertEqual(self.post('1', token='window').status_code, 403)
+        with self.settings(MOS_SPACE_STATE_TOKEN=''):
+            self.assertEqual(self.post('1', token='').status_code, 403)
+        self.assertEqual(self.post('maybe').status_code, 400)
+        self.assertFalse(SpaceStateChange.objects.exists())
+
+    def testOnlyChangesAreStored(self):
+        for value in '1', '1', 'true', '0', 'closed', '1':
+            self.assertEqual(self.post(value).status_code, 200)
+        self.assertEqual([c.open for c in SpaceStateChange.objects.order_by('pk')], [True, False, True])
+
+    def testSpaceApi(self):
+        self.assertEqual(self.client.get('/spaceapi.json').json()['state'], {'open': None})
+        self.post('1')
+        state = self.client.get('/spaceapi.json').json()['state']
+        self.assertEqual(state, {'open': True, 'lastchange': get_space_state()['lastchange']})
+
+        with self.assertNumQueries(0):
+            self.client.get('/spaceapi.json')
+
+    def testStateIsLoadedFromTheLastChange(self):
+        self.post('0')
+        cache.clear()
+        self.assertEqual(get_space_state()['open'], False)
+
+    def testPushedToWebsockets(self):
+        set_space_state(False)
+
+        async def receive_states():
+            communicator = WebsocketCommunicator(SpaceStateConsumer.as_asgi(), '/ws/spaceapi/')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            states = [await communicator.receive_json_from()]
+            await sync_to_async(set_space_state)(True)
+            states.append(await communicator.receive_json_from())
+            await communicator.disconnect()
+            return states
+
+        self.assertEqual([state['open'] for state in async_to_sync(receive_states)()], [False, True])
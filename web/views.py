@@ -1,12 +1,18 @@
+import hmac
+
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import HttpResponseBadRequest, HttpResponseForbidden, JsonResponse
 from django.conf import settings
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 
 from cal.models import Event
+from core.cache import cached_response
 from core.context_processors import custom_settings_main
 from members.models import get_active_members
 from projects.models import Project
 from sources.models import WikiChange
+from .space_state import get_space_state, set_space_state
 
 
 def display_main_page(request):
@@ -32,10 +38,15 @@ def display_cellardoor(request):
     return render(request, 'cellardoor.html', context)
 
 
+@cached_response('projects', 'space_state')
 def spaceapi(request):
     # See http://spaceapi.net/documentation
 
     projects = Project.all.order_by('-created_at')[:5]
+    current = get_space_state()
+    state = {'open': current['open']}
+    if current['lastchange']:
+        state['lastchange'] = current['lastchange']
 
     return JsonResponse({
         'api': '0.13',
@@ -74,8 +85,28 @@ def spaceapi(request):
             #},
         },
         'projects': ['https://metalab.at/wiki/%s' % project.wikiPage for project in projects if project.wikiPage],
-        'state': {
-            # TODO: Implement open state tracking
-            'open': None,
-        },
+        'state': state,
     })
+
+
+@csrf_exempt
+@require_POST
+def space_state(request):
+    """
+    Sets the open state, e.g. POST open=1 with the header
+    "Authorization: Token <MOS_SPACE_STATE_TOKEN>"
+    """
+    token = request.headers.get('Authorization', '').partition('Token ')[2]
+    if not settings.MOS_SPACE_STATE_TOKEN or \
+            not hmac.compare_digest(token.encode(), settings.MOS_SPACE_STATE_TOKEN.encode()):
+        return HttpResponseForbidden('invalid token', content_type='text/plain')
+
+    value = request.POST.get('open', '').lower()
+    if value in ('1', 'true', 'open'):
+        is_open = True
+    elif value in ('0', 'false', 'closed'):
+        is_open = False
+    else:
+        return HttpResponseBadRequest('open must be 1 or 0', content_type='text/plain')
+
+    return JsonResponse(set_space_state(is_open))